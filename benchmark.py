@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for Image to PDF Converter
+Generates a reproducible synthetic corpus (JPEG, PNG, TIFF and WebP in
+several sizes and modes, including bilevel scans), then times the conversion
+engine and the thumbnail preview path. Each scenario runs in a fresh
+process so its peak memory is measured on its own. Results are printed as
+JSON:
+
+    python benchmark.py --images 60 --output results.json
+    python benchmark.py --scenario convert --scenario thumbnails-cold
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import PIL
+from PIL import Image, ImageDraw, ImageFilter
+
+from engine import convert_images
+from instrumentation import peak_rss_bytes, process_cpu_seconds
+from pdf_writer import COMPRESSION_PROFILES, PageLayout
+from thumbnails import THUMBNAIL_SIZE, ThumbnailCache, cache_key, load_thumbnail
+
+# Pixel sizes the corpus draws from (width, height)
+IMAGE_SIZES = [(640, 480), (1600, 1200), (3000, 2000), (4000, 3000)]
+
+# A4 at 300 dpi, the usual size of a document scan
+SCAN_SIZE = (2480, 3508)
+
+DEFAULT_IMAGES = 60
+DEFAULT_SEED = 1234
+
+# Scenario name -> keyword arguments for its runner
+SCENARIOS = {
+    'convert': {'kind': 'convert'},
+    'convert-1-worker': {'kind': 'convert', 'workers': 1},
+    'convert-photo-profile': {'kind': 'convert', 'profile': 'photo'},
+    'convert-a4-150dpi': {'kind': 'convert', 'page_size': 'a4', 'dpi': 150},
+    'thumbnails-cold': {'kind': 'thumbnails'},
+    'thumbnails-warm': {'kind': 'thumbnails', 'warm': True},
+}
+
+
+# Synthetic corpus
+
+def random_bytes(rng, count):
+    return rng.getrandbits(8 * count).to_bytes(count, "little")
+
+
+def photo(rng, size):
+    """Smooth shapes plus grain, which compresses like a photograph"""
+    img = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        radius = rng.randrange(size[0] // 20, size[0] // 3)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    img = img.filter(ImageFilter.GaussianBlur(size[0] / 100))
+    grain = Image.frombytes('L', size, random_bytes(rng, size[0] * size[1]))
+    return Image.blend(img, Image.merge('RGB', (grain, grain, grain)), 0.08)
+
+
+def line_art(rng, size):
+    """A few flat colors and thin lines, like a chart or screenshot"""
+    img = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(img)
+    colors = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(6)]
+    for _ in range(60):
+        points = [(rng.randrange(size[0]), rng.randrange(size[1])) for _ in range(2)]
+        draw.line(points, fill=rng.choice(colors), width=rng.randrange(1, 6))
+    for _ in range(10):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle((x, y, x + size[0] // 8, y + size[1] // 8), fill=rng.choice(colors))
+    return img
+
+
+def document_scan(rng, size=SCAN_SIZE):
+    """Black text-like strokes on white"""
+    img = Image.new('L', size, 255)
+    draw = ImageDraw.Draw(img)
+    line_height = size[1] // 60
+    for row in range(4, 56):
+        x = size[0] // 12
+        while x < size[0] * 11 // 12:
+            width = rng.randrange(line_height, line_height * 5)
+            draw.rectangle((x, row * line_height, x + width, row * line_height + line_height // 2), fill=0)
+            x += width + line_height // 2
+    return img
+
+
+# Corpus entries: (file name suffix, image factory, save options)
+CORPUS_KINDS = [
+    ('photo.jpg', photo, {'format': 'JPEG', 'quality': 90}),
+    ('progressive.jpg', photo, {'format': 'JPEG', 'progressive': True}),
+    ('gray.jpg', lambda rng, size: photo(rng, size).convert('L'), {'format': 'JPEG'}),
+    ('lineart.png', line_art, {'format': 'PNG'}),
+    ('palette.png', lambda rng, size: line_art(rng, size).convert('P', palette=Image.Palette.ADAPTIVE),
+     {'format': 'PNG'}),
+    ('alpha.png', lambda rng, size: photo(rng, size).convert('RGBA'), {'format': 'PNG'}),
+    ('scan.tif', lambda rng, size: document_scan(rng).convert('1'),
+     {'format': 'TIFF', 'compression': 'group4'}),
+    ('gray-scan.png', lambda rng, size: document_scan(rng).filter(ImageFilter.GaussianBlur(1)),
+     {'format': 'PNG'}),
+    ('photo.tif', photo, {'format': 'TIFF', 'compression': 'tiff_lzw'}),
+    ('photo.webp', photo, {'format': 'WEBP'}),
+]
+
+
+def make_corpus(directory, count=DEFAULT_IMAGES, seed=DEFAULT_SEED):
+    """Write count synthetic images to directory and return their paths
+
+    The same count and seed always produce the same files.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        suffix, make_image, options = CORPUS_KINDS[i % len(CORPUS_KINDS)]
+        path = os.path.join(directory, f"{i:04d}-{suffix}")
+        make_image(rng, rng.choice(IMAGE_SIZES)).save(path, **options)
+        paths.append(path)
+    return paths
+
+
+# Measurements
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(fraction * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+def bench_convert(corpus, workers=None, profile='auto', page_size=None, dpi=150):
+    output_dir = tempfile.mkdtemp(prefix="img2pdf-bench-")
+    output_file = os.path.join(output_dir, "out.pdf")
+    try:
+        started, cpu_started = time.perf_counter(), process_cpu_seconds()
+        pages = convert_images(corpus, output_file, workers=workers,
+                               layout=PageLayout(page_size, dpi),
+                               profile=COMPRESSION_PROFILES[profile])
+        wall = time.perf_counter() - started
+        cpu = process_cpu_seconds() - cpu_started
+        output_bytes = os.path.getsize(output_file)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return {
+        'pages': pages,
+        'wall_seconds': round(wall, 4),
+        'cpu_seconds': round(cpu, 4),
+        'pages_per_second': round(pages / wall, 2) if wall else None,
+        'output_bytes': output_bytes,
+        'peak_rss_bytes': peak_rss_bytes(children=True),
+    }
+
+
+def bench_thumbnails(corpus, warm=False):
+    cache = ThumbnailCache()
+    if warm:
+        # First pass fills the cache; only the second (selection) pass is timed
+        for path in corpus:
+            cache.get_or_load(path, THUMBNAIL_SIZE)
+
+    latencies = []
+    started = time.perf_counter()
+    for path in corpus:
+        began = time.perf_counter()
+        if warm:
+            cache.get(cache_key(path))
+        else:
+            load_thumbnail(path, THUMBNAIL_SIZE)
+        latencies.append((time.perf_counter() - began) * 1000)
+    wall = time.perf_counter() - started
+    return {
+        'images': len(latencies),
+        'wall_seconds': round(wall, 4),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p90': round(percentile(latencies, 0.90), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(max(latencies), 3),
+            'mean': round(sum(latencies) / len(latencies), 3),
+        },
+        'peak_rss_bytes': peak_rss_bytes(children=True),
+    }
+
+
+def run_scenario(name, corpus, workers=None):
+    """Run one scenario in this process and return its results"""
+    options = dict(SCENARIOS[name])
+    kind = options.pop('kind')
+    if kind == 'convert':
+        options.setdefault('workers', workers)
+        return bench_convert(corpus, **options)
+    return bench_thumbnails(corpus, **options)
+
+
+def run_child(arguments):
+    """Run this script in a child process and return the completed process
+
+    Peak RSS survives exec on Linux, so the driver itself must stay small:
+    corpus generation happens in a child as well.
+    """
+    return subprocess.run([sys.executable, os.path.abspath(__file__)] + arguments,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_isolated(name, corpus_dir, workers=None):
+    """Run a scenario in a child process so its peak memory is its own"""
+    arguments = ["--run-one", name, "--corpus", corpus_dir]
+    if workers:
+        arguments += ["--workers", str(workers)]
+    result = run_child(arguments)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"}
+    return json.loads(result.stdout)
+
+
+def corpus_files(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the conversion engine and preview path.")
+    parser.add_argument("--images", type=int, default=DEFAULT_IMAGES,
+                        help=f"size of the synthetic corpus (default: {DEFAULT_IMAGES})")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED,
+                        help="random seed for the corpus")
+    parser.add_argument("--corpus", default=None,
+                        help="use (or create, if empty) this corpus directory instead of a temporary one")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="run only these scenarios (repeatable; default: all)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="encoding processes for conversion scenarios (default: one per CPU)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="also write the JSON results to this file")
+    parser.add_argument("--run-one", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--make-corpus", action="store_true", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.run_one:
+        print(json.dumps(run_scenario(args.run_one, corpus_files(args.corpus), args.workers)))
+        return 0
+    if args.make_corpus:
+        make_corpus(args.corpus, args.images, args.seed)
+        return 0
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="img2pdf-corpus-")
+    try:
+        os.makedirs(corpus_dir, exist_ok=True)
+        if not os.listdir(corpus_dir):
+            print(f"Generating {args.images} images in {corpus_dir}...", file=sys.stderr)
+            result = run_child(["--make-corpus", "--corpus", corpus_dir,
+                                "--images", str(args.images), "--seed", str(args.seed)])
+            if result.returncode != 0:
+                print(result.stderr, file=sys.stderr)
+                return 1
+        corpus = corpus_files(corpus_dir)
+
+        report = {
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'corpus': {
+                'images': len(corpus),
+                'bytes': sum(os.path.getsize(path) for path in corpus),
+                'seed': args.seed,
+            },
+            'results': {},
+        }
+        for name in args.scenario or list(SCENARIOS):
+            print(f"Running {name}...", file=sys.stderr)
+            report['results'][name] = run_isolated(name, corpus_dir, args.workers)
+    finally:
+        if args.corpus is None:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
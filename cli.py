@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Command-line interface for Image to PDF Converter
+Runs conversions without a display, e.g. on headless servers or in containers:
+
+    python cli.py scans/ "extra/*.png" -o output.pdf --sort name --workers 4
+    python cli.py photos/ -o album.pdf --page-size a4 --dpi 150
+    python cli.py today/*.jpg -o archive.pdf --append
+    python cli.py scans/ -o scans.pdf --report scans.json
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+from disk_cache import PageCache
+from engine import (convert_images, convert_images_split, is_image_file, parse_frame_ranges,
+                    part_file_name, sort_images)
+from instrumentation import JobReport
+from journal import JOURNAL_SUFFIX
+from pdf_writer import COMPRESSION_PROFILES, DEFAULT_DPI, PAGE_SIZES, PageLayout
+from scanner import scan_directory
+from sort_index import SORT_ORDERS
+
+# Exit status for each failure mode
+EXIT_OK = 0
+EXIT_CONVERSION_FAILED = 1
+EXIT_USAGE = 2              # also used by argparse for bad arguments
+EXIT_NO_INPUT = 3
+EXIT_OUTPUT_EXISTS = 4
+EXIT_PAGES_SKIPPED = 5
+EXIT_INTERRUPTED = 130
+
+
+# Suffixes accepted by --split-size
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+class InputError(Exception):
+    """Raised when an input argument does not resolve to any image"""
+
+
+def parse_size(text):
+    """Parse a byte count such as 500K, 25M or 2G"""
+    text = text.strip().upper().rstrip('B')
+    unit = text[-1:] if text[-1:] in SIZE_UNITS else ''
+    try:
+        size = float(text[:len(text) - len(unit)]) * SIZE_UNITS[unit]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r} (use e.g. 500K, 25M, 2G)")
+    if size < 1:
+        raise argparse.ArgumentTypeError("size must be positive")
+    return int(size)
+
+
+def parse_frames(text):
+    """Parse a --frames selection such as 1-3,7,10-"""
+    try:
+        return parse_frame_ranges(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def expand_inputs(inputs, recursive=False):
+    """Expand files, glob patterns and directories into a list of image paths"""
+    image_files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            image_files.extend(scan_directory(item, recursive))
+        elif glob.has_magic(item):
+            matches = sorted(path for path in glob.glob(item, recursive=True)
+                             if os.path.isfile(path) and is_image_file(path))
+            if not matches:
+                raise InputError(f"no images match '{item}'")
+            image_files.extend(matches)
+        elif os.path.isfile(item):
+            image_files.append(item)
+        else:
+            raise InputError(f"input not found: {item}")
+
+    # Drop duplicates while keeping the first occurrence
+    seen = set()
+    unique = []
+    for path in image_files:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+
+def add_encoding_options(parser):
+    """Add the options that decide how pages are encoded (shared with watch.py)"""
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of encoding processes (default: one per CPU)")
+    parser.add_argument("--page-size", choices=["native"] + list(PAGE_SIZES), default="native",
+                        help="fit every image on this paper size (default: page matches the image)")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI,
+                        help=f"output resolution for --page-size; larger images are "
+                             f"downsampled (default: {DEFAULT_DPI})")
+    parser.add_argument("-c", "--compression", choices=list(COMPRESSION_PROFILES), default="auto",
+                        help="auto: pick JPEG, Flate or CCITT G4 per page; photo: JPEG for "
+                             "every page; compact: smaller output, more lossy (default: auto)")
+    parser.add_argument("--jpeg-quality", type=int, default=None, metavar="1-95",
+                        help="JPEG quality for photo pages (default: set by the profile)")
+    parser.add_argument("--frames", type=parse_frames, default=None, metavar="RANGES",
+                        help="frames of multi-page TIFF and animated GIF/WebP inputs to convert, "
+                             "e.g. 1 or 1-3,7,10- (default: every frame, one page each)")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse encoded pages from earlier runs (stored in the user cache directory)")
+
+
+def encoding_options(parser, args):
+    """Check the encoding options and return them as convert_images keyword arguments"""
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.dpi < 1:
+        parser.error("--dpi must be at least 1")
+    if args.jpeg_quality is not None and not 1 <= args.jpeg_quality <= 95:
+        parser.error("--jpeg-quality must be between 1 and 95")
+
+    profile = COMPRESSION_PROFILES[args.compression]
+    if args.jpeg_quality is not None:
+        profile = profile.with_quality(args.jpeg_quality)
+    return dict(
+        workers=args.workers,
+        layout=PageLayout(None if args.page_size == "native" else args.page_size, args.dpi),
+        profile=profile,
+        page_cache=PageCache.open_default() if args.cache else None,
+        frames=args.frames
+    )
+
+
+def build_parser():
+    """Create the argument parser"""
+    parser = argparse.ArgumentParser(
+        description="Convert images into a single PDF document (no GUI required).",
+        epilog="Exit status: 0 success, 1 conversion failed, 2 bad arguments, "
+               "3 no input images, 4 output already exists, 5 written but some images "
+               "skipped, 130 interrupted."
+    )
+    parser.add_argument("inputs", nargs="+", metavar="INPUT",
+                        help="image files, glob patterns or directories")
+    parser.add_argument("-o", "--output", required=True,
+                        help="path of the PDF to create")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="include images in subdirectories of directory inputs")
+    parser.add_argument("-s", "--sort", choices=list(SORT_ORDERS), default="input",
+                        help="page order: natural sorts scan2 before scan10, taken uses the EXIF "
+                             "capture time (default: order given on the command line)")
+    parser.add_argument("--reverse", action="store_true",
+                        help="reverse the page order")
+    add_encoding_options(parser)
+    parser.add_argument("--split-pages", type=int, default=None, metavar="N",
+                        help="write NAME_001.pdf, NAME_002.pdf, ... with at most N pages each; "
+                             "parts are written concurrently")
+    parser.add_argument("--split-size", type=parse_size, default=None, metavar="SIZE",
+                        help="start a new part before a file would grow past about SIZE "
+                             "(e.g. 25M, 1G); can be combined with --split-pages")
+    parser.add_argument("-a", "--append", action="store_true",
+                        help="add the pages to the end of the output PDF if it exists, "
+                             "without rewriting it")
+    parser.add_argument("--strict", action="store_true",
+                        help="stop at the first image that can't be converted instead of skipping it")
+    parser.add_argument("--restart", action="store_true",
+                        help="start over instead of resuming an interrupted run of the same job")
+    parser.add_argument("--report", default=None, metavar="FILE",
+                        help="save per-page stage timings, byte counts and peak memory as JSON "
+                             "(written even if the conversion fails)")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="overwrite the output file if it exists")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="only print errors")
+    return parser
+
+
+def save_report(job_report, path):
+    """Write the job report to path, if one was requested; False if it could not be saved"""
+    if job_report is None or job_report.status is None:
+        return True
+    try:
+        job_report.write(path)
+    except OSError as e:
+        print(f"error: cannot write report: {e}", file=sys.stderr)
+        return False
+    return True
+
+
+def print_resume_hint(output_file):
+    """Point at the checkpoint an interrupted job left behind, if there is one"""
+    if os.path.exists(output_file + JOURNAL_SUFFIX):
+        print("progress was saved; run the same command again to resume "
+              "(--restart to start over)", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    options = encoding_options(parser, args)
+    if args.split_pages is not None and args.split_pages < 1:
+        parser.error("--split-pages must be at least 1")
+    split = bool(args.split_pages or args.split_size)
+    if split and args.append:
+        parser.error("--append cannot be combined with --split-pages or --split-size")
+
+    try:
+        image_files = expand_inputs(args.inputs, args.recursive)
+    except (InputError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_NO_INPUT
+
+    if not image_files:
+        print("error: no input images found", file=sys.stderr)
+        return EXIT_NO_INPUT
+
+    first_output = part_file_name(args.output, 1) if split else args.output
+    if os.path.exists(first_output) and not (args.force or args.append):
+        print(f"error: {first_output} already exists (use --force to overwrite)", file=sys.stderr)
+        return EXIT_OUTPUT_EXISTS
+
+    # Pages in the job, known once the first one is done (multi-frame inputs add pages)
+    page_total = 0
+
+    def show_progress(done, total, image_file):
+        nonlocal page_total
+        page_total = total
+        if not args.quiet:
+            print(f"[{done}/{total}] {os.path.basename(image_file)}", file=sys.stderr)
+
+    skipped = []
+
+    def skip(image_file, reason):
+        skipped.append(image_file)
+        print(f"warning: skipped {image_file}: {reason}", file=sys.stderr)
+
+    job_report = JobReport() if args.report else None
+    options.update(
+        progress=show_progress,
+        report=job_report,
+        skip_errors=not args.strict,
+        on_skip=skip
+    )
+    try:
+        image_files = sort_images(image_files, args.sort, args.reverse)
+        if split:
+            outputs = convert_images_split(image_files, args.output, max_pages=args.split_pages,
+                                           max_bytes=args.split_size, **options)
+            page_count = page_total - len(skipped)
+        else:
+            page_count = convert_images(image_files, args.output, append=args.append,
+                                        resume=not args.restart, **options)
+    except KeyboardInterrupt:
+        print("interrupted", file=sys.stderr)
+        save_report(job_report, args.report)
+        if not split:
+            print_resume_hint(args.output)
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        print(f"error: conversion failed: {e}", file=sys.stderr)
+        save_report(job_report, args.report)
+        if not split:
+            print_resume_hint(args.output)
+        return EXIT_CONVERSION_FAILED
+
+    if not save_report(job_report, args.report):
+        return EXIT_CONVERSION_FAILED
+    if not args.quiet:
+        pages = f"{page_count} page{'s' if page_count != 1 else ''}"
+        if split:
+            print(f"Wrote {pages} to {len(outputs)} files: {', '.join(outputs)}")
+        else:
+            print(f"{'Appended' if args.append else 'Wrote'} {pages} to {args.output}")
+    if skipped:
+        print(f"warning: {len(skipped)} image{'s' if len(skipped) != 1 else ''} skipped",
+              file=sys.stderr)
+        return EXIT_PAGES_SKIPPED
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+Persistent thumbnail, metadata and encoded page caches for Image to PDF Converter
+Entries live in SQLite databases under the user cache directory: thumbnails
+are keyed on path, mtime and size, encoded pages on a hash of the source
+bytes and the encoding settings. SQLite's locking keeps it safe when several
+instances of the app share the cache.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# Upper bound for stored thumbnail bytes before the least recently used are evicted
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# How long a writer waits for another instance to release the database (seconds)
+BUSY_TIMEOUT = 5.0
+
+# Running byte total of a cache table, kept up to date by triggers so every
+# instance sharing the file sees it and eviction never has to sum the table
+USAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (total INTEGER NOT NULL);
+INSERT INTO usage SELECT COALESCE(SUM({size}), 0) FROM {table} WHERE NOT EXISTS (SELECT 1 FROM usage);
+CREATE TRIGGER IF NOT EXISTS {table}_added AFTER INSERT ON {table}
+BEGIN UPDATE usage SET total = total + NEW.{size}; END;
+CREATE TRIGGER IF NOT EXISTS {table}_removed AFTER DELETE ON {table}
+BEGIN UPDATE usage SET total = total - OLD.{size}; END;
+"""
+
+# The thumbnail blob comes last so metadata lookups and eviction don't read it
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    mode TEXT,
+    format TEXT,
+    thumbnail_bytes INTEGER NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL,
+    thumbnail BLOB,
+    PRIMARY KEY (path, mtime_ns, size)
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+"""
+
+# Upper bound for stored page streams before the least recently used are evicted
+DEFAULT_PAGE_CACHE_BYTES = 1024 * 1024 * 1024
+
+# Columns read without the page data come before the blobs, so SQLite doesn't
+# have to walk a blob's overflow pages to reach them
+PAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    digest TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    color_space TEXT NOT NULL,
+    bits_per_component INTEGER NOT NULL,
+    filter_name TEXT NOT NULL,
+    decode_parms TEXT,
+    placement TEXT NOT NULL,
+    data_bytes INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    palette BLOB,
+    data BLOB NOT NULL,
+    PRIMARY KEY (digest, settings)
+);
+CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used);
+"""
+
+
+def user_cache_dir():
+    """Return the per-user cache directory for this application"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "image-to-pdf-converter")
+
+
+class SQLiteCache:
+    """Shared plumbing for the SQLite-backed caches
+
+    Subclasses set schema, table and size_column (the per-row byte count that
+    max_bytes applies to), and bump schema_version when the table changes:
+    a cache file written with another version is emptied and rebuilt. Every
+    public method swallows database errors
+    (read-only home, corrupt file, lock timeouts) and behaves like a cache
+    miss, so the app keeps working without it.
+    """
+
+    schema = None
+    table = None
+    size_column = None
+    schema_version = 1
+
+    def __init__(self, db_path, max_bytes):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        # sqlite3 connections may only be used on the thread that created them
+        self._local = threading.local()
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # INSERT OR REPLACE must run the delete trigger for the row it replaces
+            connection.execute("PRAGMA recursive_triggers=ON")
+            schema = self.schema + USAGE_SCHEMA.format(table=self.table, size=self.size_column)
+            if connection.execute("PRAGMA user_version").fetchone()[0] != self.schema_version:
+                connection.executescript(
+                    f"BEGIN IMMEDIATE; DROP TABLE IF EXISTS {self.table}; DROP TABLE IF EXISTS usage;"
+                    f"{schema} PRAGMA user_version = {self.schema_version}; COMMIT;"
+                )
+            else:
+                connection.executescript(schema)
+            self._local.connection = connection
+        return connection
+
+    def evict(self):
+        """Remove least recently used rows until the cache fits max_bytes"""
+        connection = self._connect()
+        with connection:
+            total = connection.execute("SELECT total FROM usage").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            # Evict down to 90% so the next few inserts don't trigger another pass
+            excess = total - int(self.max_bytes * 0.9)
+            rows = connection.execute(
+                f"SELECT rowid, {self.size_column} FROM {self.table} ORDER BY last_used"
+            )
+            doomed = []
+            for rowid, size in rows:
+                if excess <= 0:
+                    break
+                doomed.append((rowid,))
+                excess -= size
+            connection.executemany(f"DELETE FROM {self.table} WHERE rowid = ?", doomed)
+
+    def clear(self):
+        """Remove every entry"""
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute(f"DELETE FROM {self.table}")
+        except (sqlite3.Error, OSError):
+            pass
+
+
+class DiskCache(SQLiteCache):
+    """SQLite-backed store of image metadata and encoded thumbnails"""
+
+    schema = SCHEMA
+    table = "entries"
+    size_column = "thumbnail_bytes"
+    schema_version = 2
+
+    def __init__(self, db_path, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(db_path, max_bytes)
+
+    @classmethod
+    def open_default(cls, max_bytes=DEFAULT_MAX_BYTES):
+        """Open the cache in the user cache directory"""
+        return cls(os.path.join(user_cache_dir(), "cache.sqlite3"), max_bytes)
+
+    def get(self, key):
+        """Return (metadata dict, thumbnail bytes or None) for key, or None on a miss"""
+        try:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT width, height, mode, format, thumbnail FROM entries "
+                "WHERE path = ? AND mtime_ns = ? AND size = ?", tuple(key)
+            ).fetchone()
+            if row is None:
+                return None
+            with connection:
+                connection.execute(
+                    "UPDATE entries SET last_used = ? "
+                    "WHERE path = ? AND mtime_ns = ? AND size = ?", (time.time(),) + tuple(key)
+                )
+        except (sqlite3.Error, OSError):
+            return None
+        return self._metadata(key, row), row[4]
+
+    def get_metadata(self, key):
+        """Return the metadata dict for key, or None on a miss (read-only, no LRU update)"""
+        try:
+            row = self._connect().execute(
+                "SELECT width, height, mode, format FROM entries "
+                "WHERE path = ? AND mtime_ns = ? AND size = ?", tuple(key)
+            ).fetchone()
+        except (sqlite3.Error, OSError):
+            return None
+        return self._metadata(key, row) if row is not None else None
+
+    @staticmethod
+    def _metadata(key, row):
+        return {
+            'width': row[0],
+            'height': row[1],
+            'mode': row[2],
+            'format': row[3],
+            'file_size': key[2],
+        }
+
+    def put(self, key, metadata, thumbnail=None):
+        """Store metadata (and optionally encoded thumbnail bytes) for key"""
+        thumbnail_bytes = len(thumbnail) if thumbnail is not None else 0
+        try:
+            connection = self._connect()
+            with connection:
+                # Older versions of the same file can never be hit again
+                connection.execute("DELETE FROM entries WHERE path = ?", (key[0],))
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries (path, mtime_ns, size, width, height, mode, format, "
+                    "thumbnail_bytes, last_used, thumbnail) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    tuple(key) + (
+                        metadata.get('width'),
+                        metadata.get('height'),
+                        metadata.get('mode'),
+                        metadata.get('format'),
+                        thumbnail_bytes,
+                        time.time(),
+                        thumbnail,
+                    )
+                )
+            if thumbnail_bytes:
+                self.evict()
+        except (sqlite3.Error, OSError):
+            pass
+
+
+class PageCache(SQLiteCache):
+    """SQLite-backed store of encoded PDF page streams
+
+    Rows are keyed on the content hash of the source file and a string
+    describing the page layout and compression settings, so a repeated job
+    (or the same image in another job) reuses the earlier encode.
+    """
+
+    schema = PAGE_SCHEMA
+    table = "pages"
+    size_column = "data_bytes"
+    schema_version = 2
+
+    def __init__(self, db_path, max_bytes=DEFAULT_PAGE_CACHE_BYTES):
+        super().__init__(db_path, max_bytes)
+
+    @classmethod
+    def open_default(cls, max_bytes=DEFAULT_PAGE_CACHE_BYTES):
+        """Open the cache in the user cache directory"""
+        return cls(os.path.join(user_cache_dir(), "pages.sqlite3"), max_bytes)
+
+    def get(self, digest, settings):
+        """Return a dict of ImagePage fields for the encode, or None on a miss"""
+        try:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT width, height, color_space, bits_per_component, filter_name, "
+                "decode_parms, palette, placement, data FROM pages "
+                "WHERE digest = ? AND settings = ?", (digest, settings)
+            ).fetchone()
+            if row is None:
+                return None
+            with connection:
+                connection.execute(
+                    "UPDATE pages SET last_used = ? WHERE digest = ? AND settings = ?",
+                    (time.time(), digest, settings)
+                )
+        except (sqlite3.Error, OSError):
+            return None
+        page_size, image_box = json.loads(row[7])
+        return {
+            'width': row[0],
+            'height': row[1],
+            'color_space': row[2],
+            'bits_per_component': row[3],
+            'filter_name': row[4],
+            'decode_parms': json.loads(row[5]) if row[5] is not None else None,
+            'palette': row[6],
+            'page_size': tuple(page_size),
+            'image_box': tuple(image_box),
+            'data': row[8],
+        }
+
+    def put(self, digest, settings, fields):
+        """Store the ImagePage fields (as returned by get) for an encode"""
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO pages (digest, settings, width, height, color_space, "
+                    "bits_per_component, filter_name, decode_parms, placement, data_bytes, last_used, "
+                    "palette, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        digest,
+                        settings,
+                        fields['width'],
+                        fields['height'],
+                        fields['color_space'],
+                        fields['bits_per_component'],
+                        fields['filter_name'],
+                        json.dumps(fields['decode_parms']) if fields['decode_parms'] is not None else None,
+                        json.dumps([fields['page_size'], fields['image_box']]),
+                        len(fields['data']),
+                        time.time(),
+                        fields['palette'],
+                        fields['data'],
+                    )
+                )
+            self.evict()
+        except (sqlite3.Error, OSError):
+            pass
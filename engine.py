@@ -0,0 +1,453 @@
+"""
+Conversion engine for Image to PDF Converter
+Shared by the desktop app and the command-line interface. This module must
+never import tkinter so it can run on headless machines.
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from journal import ConversionJournal, job_key
+from pdf_writer import (DEFAULT_PROFILE, NATIVE_LAYOUT, PageError, PDFWriter, encode_image,
+                        encode_images, encoding_settings, frame_count, split_source)
+from sort_index import SortIndex
+
+# File extensions picked up when a directory is given as input
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif', '.webp')
+
+# Rough bytes a page adds besides its image data (page, contents and xref entries)
+PAGE_OVERHEAD_BYTES = 512
+
+
+class ConversionCancelled(Exception):
+    """Raised when a conversion is stopped through its cancel event"""
+
+
+class ConversionFailed(Exception):
+    """Raised when a conversion ends without a single page to write"""
+
+
+class _AnyEvent:
+    """Looks like a threading.Event that is set when any of the given events is"""
+
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self):
+        return any(event.is_set() for event in self.events)
+
+
+def is_image_file(path):
+    """Check whether a path has one of the supported image extensions"""
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def sort_images(image_files, order='input', reverse=False, index=None):
+    """Return image_files in the requested page order
+
+    Orders that need file details read them once per file, in parallel;
+    index, a sort_index.SortIndex, keeps them between calls.
+    """
+    if index is None:
+        index = SortIndex()
+    return index.sort(list(image_files), order, reverse)
+
+
+def parse_frame_ranges(text):
+    """Parse a frame selection such as '1-3,7,10-' into [(1, 3), (7, 7), (10, None)]
+
+    Frames are numbered from 1; an open end runs to the last frame.
+    """
+    ranges = []
+    for part in text.replace(' ', '').split(','):
+        first, dash, last = part.partition('-')
+        try:
+            first = int(first)
+            last = (int(last) if last else None) if dash else first
+        except ValueError:
+            raise ValueError(f"invalid frame range {part!r} (use e.g. 1-3,7,10-)") from None
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"invalid frame range {part!r} (use e.g. 1-3,7,10-)")
+        ranges.append((first, last))
+    return ranges
+
+
+def select_frames(ranges, count):
+    """0-based indices of the frames ranges picks from a file with count frames"""
+    if ranges is None:
+        return list(range(count))
+    indices = []
+    for first, last in ranges:
+        last = count if last is None else min(last, count)
+        indices.extend(range(first - 1, last))
+    return indices
+
+
+def expand_frames(image_files, frames=None):
+    """List the page sources for image_files, one per page
+
+    A multi-frame file (TIFF, GIF, WebP) gives a (path, frame) pair for each
+    frame picked by frames (ranges from parse_frame_ranges, all if None);
+    other images give (path, None). Items that are pairs already are kept.
+    Only frame headers are read here, pixels are decoded page by page.
+    """
+    sources = []
+    for item in image_files:
+        if not isinstance(item, str):
+            sources.append(tuple(item))
+            continue
+        count = frame_count(item)
+        if count == 1:
+            sources.append((item, None))
+        else:
+            sources.extend((item, index) for index in select_frames(frames, count))
+    return sources
+
+
+def convert_images(image_files, output_file, workers=None, progress=None, cancel_event=None,
+                   layout=NATIVE_LAYOUT, profile=DEFAULT_PROFILE, append=False, page_cache=None,
+                   report=None, skip_errors=True, on_skip=None, resume=True, frames=None,
+                   executor=None):
+    """Convert images into a single PDF and return the number of pages written
+
+    Multi-frame images (TIFF, GIF, WebP) give one page per frame, or per
+    frame picked by frames (see parse_frame_ranges and expand_frames).
+
+    progress, if given, is called as progress(done, total, image_file) after
+    each page is written, total counting pages. Setting cancel_event stops the job between pages,
+    removes the partial output and raises ConversionCancelled. layout (a
+    pdf_writer.PageLayout) sets the page size and output resolution, profile
+    (a pdf_writer.CompressionProfile) how each page is compressed.
+
+    The PDF is written next to output_file and renamed into place when it is
+    complete. After every page a checkpoint goes to a journal beside it; if
+    the job fails (or the process dies) the partial file and journal are
+    kept, and with resume=True a rerun with the same images and settings
+    continues after the last finished page. An image changed on disk since
+    (size or modification time) starts the job over.
+
+    With skip_errors=True an image that can't be converted is left out and
+    on_skip(image_file, message) is called for it; otherwise the first bad
+    image stops the job. It fails anyway (ConversionFailed) if no image at all could
+    be read or frames leaves nothing to convert.
+
+    With append=True the pages are added to output_file as an incremental
+    update if it already exists; a cancelled or failed append leaves the
+    existing document untouched. Appends are not journaled.
+
+    Identical images (by content hash) are encoded once and shared by every
+    page that shows them; page_cache (a disk_cache.PageCache) lets later jobs
+    reuse encoded pages.
+
+    report, an instrumentation.JobReport, receives per-page stage timings
+    and skipped images, and is started and finished around the job unless
+    the caller already started it. executor, a ProcessPoolExecutor, runs the
+    encodes instead of a pool of the job's own (see encode_images).
+    """
+    image_files = list(image_files)
+    sources = expand_frames(image_files, frames)
+    total = len(sources)
+    appending = append and os.path.exists(output_file)
+
+    journal = key = None
+    entries = []
+    if not appending:
+        journal = ConversionJournal(output_file)
+        key = job_key(sources, encoding_settings(layout, profile))
+        if resume:
+            entries = journal.load(key)
+    start = len(entries)
+
+    with _reporting(report, [output_file], workers, layout, profile, images=len(image_files),
+                    pages=total, output=output_file, resumed_from=start):
+        _check_sources(image_files, sources)
+        writer = None
+        if entries:
+            try:
+                writer = PDFWriter(output_file, checkpoints=[entry['checkpoint'] for entry in entries])
+            except (OSError, ValueError):
+                # The partial file is gone or damaged; start over
+                start = 0
+        if writer is None:
+            writer = PDFWriter(output_file, append=append)
+        if journal is not None:
+            journal.start(key, resume=start > 0)
+        skipped = 0
+        for entry in entries[:start]:
+            if entry['skipped'] is not None:
+                skipped += 1
+                _skip_page(entry['image'], entry['skipped'], on_skip, report)
+
+        # Encode pages in parallel and write them in order, one at a time
+        pages = encode_images(sources[start:], workers=workers, layout=layout, profile=profile,
+                              page_cache=page_cache, skip_errors=skip_errors, executor=executor)
+        try:
+            for i, page in enumerate(pages, start):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise ConversionCancelled()
+                image_file, frame = split_source(sources[i])
+                if isinstance(page, PageError):
+                    skipped += 1
+                    reason = _skip_reason(frame, page.message)
+                    _skip_page(image_file, reason, on_skip, report)
+                else:
+                    _write_page(writer, page, report)
+                    reason = None
+                if journal is not None:
+                    journal.record(i, image_file, writer.checkpoint(), reason)
+                if progress is not None:
+                    progress(i + 1, total, image_file)
+
+            if skipped and skipped == total:
+                raise ConversionFailed("none of the images could be converted")
+            with _job_stage(report, 'save'):
+                writer.close()
+        except BaseException as e:
+            if journal is None or isinstance(e, (ConversionCancelled, ConversionFailed)):
+                writer.abort()
+                if journal is not None:
+                    journal.remove()
+            else:
+                # Keep the partial file and journal so a rerun can resume
+                writer.suspend()
+                journal.close()
+            raise
+        finally:
+            pages.close()
+        if journal is not None:
+            journal.remove()
+
+    return writer.page_count
+
+
+def _check_sources(image_files, sources):
+    """Fail a job with nothing to convert rather than write an empty document"""
+    if not sources:
+        raise ConversionFailed("no frames match the frame selection" if image_files
+                               else "no images to convert")
+
+
+def _skip_reason(frame, message):
+    return message if frame is None else f"frame {frame + 1}: {message}"
+
+
+def _skip_page(image_file, message, on_skip, report):
+    if on_skip is not None:
+        on_skip(image_file, message)
+    if report is not None:
+        report.add_skipped(image_file, message)
+
+
+@contextmanager
+def _reporting(report, output_files, workers, layout, profile, **details):
+    """Start and finish report around a job, unless there is none or it is already running"""
+    if report is None or report.running:
+        yield
+        return
+    report.start(workers=workers or os.cpu_count() or 1, page_size=layout.page_size,
+                 dpi=layout.dpi, jpeg_quality=profile.jpeg_quality,
+                 settings=encoding_settings(layout, profile), **details)
+    try:
+        yield
+    except BaseException as e:
+        status = 'cancelled' if isinstance(e, (ConversionCancelled, KeyboardInterrupt)) else 'failed'
+        report.finish(status, error=e)
+        raise
+    report.finish('ok', output_files)
+
+
+def _job_stage(report, name):
+    return report.stage(name) if report is not None else nullcontext()
+
+
+def _write_page(writer, page, report):
+    """Add a page to writer, timing the write and passing its stats to report"""
+    before = writer.size
+    with page.stats.stage('write'):
+        writer.add_page(page)
+    page.stats.bytes_written = writer.size - before
+    if report is not None:
+        report.add_page(page.stats)
+
+
+def part_file_name(output_file, number):
+    """Name of one part of a split job: name.pdf -> name_001.pdf"""
+    base, ext = os.path.splitext(output_file)
+    return f"{base}_{number:03d}{ext or '.pdf'}"
+
+
+def remove_files(paths):
+    """Delete files, ignoring any that are already gone"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def convert_images_split(image_files, output_file, max_pages=None, max_bytes=None, workers=None,
+                         progress=None, cancel_event=None, layout=NATIVE_LAYOUT,
+                         profile=DEFAULT_PROFILE, page_cache=None, report=None,
+                         skip_errors=True, on_skip=None, frames=None):
+    """Convert images into numbered PDFs (name_001.pdf, ...) and return their paths
+
+    Each part holds at most max_pages pages and, if max_bytes is given, stops
+    before the page that would take it past about max_bytes (a part always
+    gets at least one page). Parts capped by page count alone are independent
+    and written concurrently; with a byte cap the boundaries depend on the
+    encoded sizes, so parts are written one after another. If the job fails
+    or is cancelled, every part written so far is removed. report, frames,
+    skip_errors and on_skip work as for convert_images; a part whose images
+    all fail is left out. Only parts capped by page count are journaled for
+    resuming.
+    """
+    if not max_pages and not max_bytes:
+        raise ValueError("either max_pages or max_bytes must be given")
+    image_files = list(image_files)
+    sources = expand_frames(image_files, frames)
+    paths = []
+    with _reporting(report, paths, workers, layout, profile, images=len(image_files),
+                    pages=len(sources), output=output_file, max_pages=max_pages,
+                    max_bytes=max_bytes):
+        _check_sources(image_files, sources)
+        options = dict(workers=workers, progress=progress, cancel_event=cancel_event, layout=layout,
+                       profile=profile, page_cache=page_cache, report=report,
+                       skip_errors=skip_errors, on_skip=on_skip)
+        if max_bytes:
+            paths += _convert_rolling(sources, output_file, max_pages, max_bytes, **options)
+        else:
+            paths += _convert_parts(sources, output_file, max_pages, **options)
+    return paths
+
+
+def _convert_parts(sources, output_file, max_pages, workers, progress, cancel_event,
+                   layout, profile, page_cache, report, skip_errors, on_skip):
+    """Write fixed-size parts concurrently, each in order, sharing one pool of encoder processes"""
+    chunks = [sources[i:i + max_pages] for i in range(0, len(sources), max_pages)]
+    paths = [part_file_name(output_file, number) for number in range(1, len(chunks) + 1)]
+    total = len(sources)
+    workers = workers or os.cpu_count() or 1
+    parallel = max(1, min(len(chunks), workers))
+    # Each part keeps its share of the in-flight window, but any idle process
+    # takes the next page of whichever part has one queued
+    encoders = ProcessPoolExecutor(max_workers=min(workers, total)) if workers > 1 else None
+
+    # Parts stop as soon as one of them fails or the caller cancels
+    failed = threading.Event()
+    stop = _AnyEvent(cancel_event, failed)
+    lock = threading.Lock()
+    done = 0
+
+    def count_page(part_done, part_total, image_file):
+        nonlocal done
+        with lock:
+            done += 1
+            if progress is not None:
+                progress(done, total, image_file)
+
+    def write_part(chunk, path):
+        try:
+            convert_images(chunk, path, workers=max(1, workers // parallel), progress=count_page,
+                           cancel_event=stop, layout=layout, profile=profile,
+                           page_cache=page_cache, report=report,
+                           skip_errors=skip_errors, on_skip=on_skip, executor=encoders)
+        except ConversionFailed:
+            # Every image in this part was skipped
+            return None
+        except BaseException:
+            failed.set()
+            raise
+        return path
+
+    executor = ThreadPoolExecutor(max_workers=parallel)
+    try:
+        futures = [executor.submit(write_part, chunk, path) for chunk, path in zip(chunks, paths)]
+        errors = [future.exception() for future in futures]
+        written = [future.result() for future, error in zip(futures, errors) if error is None]
+    except BaseException:
+        # e.g. KeyboardInterrupt while waiting: stop the parts, then clean up
+        failed.set()
+        executor.shutdown(wait=True)
+        remove_files(paths)
+        raise
+    finally:
+        if encoders is not None:
+            encoders.shutdown(wait=True)
+    executor.shutdown(wait=True)
+
+    # Report the error that stopped the job rather than the parts it cancelled
+    errors = [error for error in errors if error is not None]
+    if errors:
+        remove_files(paths)
+        real = [error for error in errors if not isinstance(error, ConversionCancelled)]
+        raise (real or errors)[0]
+    written = [path for path in written if path is not None]
+    if not written:
+        raise ConversionFailed("none of the images could be converted")
+    return written
+
+
+def _convert_rolling(sources, output_file, max_pages, max_bytes, workers, progress,
+                     cancel_event, layout, profile, page_cache, report, skip_errors, on_skip):
+    """Write parts in sequence, starting a new one when the current one is full"""
+    total = len(sources)
+    paths = []
+    writer = None
+    pages = encode_images(sources, workers=workers, layout=layout, profile=profile,
+                          page_cache=page_cache, skip_errors=skip_errors)
+    try:
+        for i, page in enumerate(pages):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ConversionCancelled()
+
+            image_file, frame = split_source(sources[i])
+            if isinstance(page, PageError):
+                _skip_page(image_file, _skip_reason(frame, page.message), on_skip, report)
+                if progress is not None:
+                    progress(i + 1, total, image_file)
+                continue
+
+            if page.data is None and (writer is None or not writer.has_image(page.digest)):
+                # The shared image lives in an earlier part; this part needs its own copy
+                page = _reencode(page, sources[i], layout, profile)
+
+            if writer is not None and writer.page_count:
+                page_bytes = (len(page.data) if page.data is not None else 0) + PAGE_OVERHEAD_BYTES
+                if ((max_pages and writer.page_count >= max_pages)
+                        or writer.size + page_bytes > max_bytes):
+                    with _job_stage(report, 'save'):
+                        writer.close()
+                    writer = None
+
+            if writer is None:
+                paths.append(part_file_name(output_file, len(paths) + 1))
+                writer = PDFWriter(paths[-1])
+                if page.data is None:
+                    page = _reencode(page, sources[i], layout, profile)
+            _write_page(writer, page, report)
+            if progress is not None:
+                progress(i + 1, total, image_file)
+
+        if writer is not None:
+            with _job_stage(report, 'save'):
+                writer.close()
+        elif total:
+            raise ConversionFailed("none of the images could be converted")
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        remove_files(paths)
+        raise
+    finally:
+        pages.close()
+
+    return paths
+
+
+def _reencode(page, source, layout, profile):
+    """Encode a shared page again, for a part that does not hold its image yet"""
+    encoded = encode_image(source, layout, profile)
+    encoded.digest = page.digest
+    return encoded
@@ -0,0 +1,264 @@
+"""
+File list model and virtualized list widget for Image to PDF Converter
+Only the rows that fit on screen exist as Listbox items; row text is pulled
+from a callback on demand, so long lists cost nothing to reorder or redraw.
+"""
+
+import os
+import tkinter as tk
+import tkinter.font as tkfont
+
+
+def file_identity(path):
+    """Identity used to spot the same file reached through different paths
+
+    (device, inode) catches symlinks and hard links; the resolved real path is
+    the fallback when the file cannot be stat'ed or has no inode number.
+    """
+    try:
+        stat = os.stat(path)
+        if stat.st_ino:
+            return (stat.st_dev, stat.st_ino)
+    except OSError:
+        pass
+    return os.path.normcase(os.path.realpath(path))
+
+
+class IndexedFileSet:
+    """Ordered list of image paths with constant-time membership and index lookup
+
+    Files are de-duplicated on file_identity, so the same image added through a
+    symlink or a different relative path only appears once. Positions in the
+    index are refreshed lazily after removals, keeping pop() cheap.
+    """
+
+    def __init__(self, paths=()):
+        self._paths = []
+        self._identities = []
+        self._positions = {}
+        self._stale_from = None
+        self.extend(paths)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __getitem__(self, index):
+        return self._paths[index]
+
+    def __contains__(self, path):
+        return file_identity(path) in self._positions
+
+    def add(self, path):
+        """Append path unless the same file is already in the set; return True if added"""
+        identity = file_identity(path)
+        if identity in self._positions:
+            return False
+        self._positions[identity] = len(self._paths)
+        self._paths.append(path)
+        self._identities.append(identity)
+        return True
+
+    def extend(self, paths):
+        """Add several paths and return how many were new"""
+        return sum(1 for path in paths if self.add(path))
+
+    def index(self, path):
+        """Position of path (or another path to the same file)"""
+        identity = file_identity(path)
+        if identity not in self._positions:
+            raise ValueError(f"{path} is not in the list")
+        self._refresh_positions()
+        return self._positions[identity]
+
+    def swap(self, i, j):
+        """Exchange the files at positions i and j"""
+        self._paths[i], self._paths[j] = self._paths[j], self._paths[i]
+        self._identities[i], self._identities[j] = self._identities[j], self._identities[i]
+        self._positions[self._identities[i]] = i
+        self._positions[self._identities[j]] = j
+
+    def pop(self, index=-1):
+        """Remove and return the path at index"""
+        if index < 0:
+            index += len(self._paths)
+        path = self._paths.pop(index)
+        del self._positions[self._identities.pop(index)]
+        if self._stale_from is None or index < self._stale_from:
+            self._stale_from = index
+        return path
+
+    def sort(self, key=None, reverse=False):
+        """Sort in place by a key on the path"""
+        if key is None:
+            key = str
+        order = sorted(range(len(self._paths)), key=lambda i: key(self._paths[i]), reverse=reverse)
+        self._paths = [self._paths[i] for i in order]
+        self._identities = [self._identities[i] for i in order]
+        self._stale_from = 0
+        self._refresh_positions()
+
+    def reverse(self):
+        """Reverse the order in place"""
+        self._paths.reverse()
+        self._identities.reverse()
+        self._stale_from = 0
+        self._refresh_positions()
+
+    def clear(self):
+        """Remove every file"""
+        self._paths.clear()
+        self._identities.clear()
+        self._positions.clear()
+        self._stale_from = None
+
+    def _refresh_positions(self):
+        if self._stale_from is None:
+            return
+        for position in range(self._stale_from, len(self._identities)):
+            self._positions[self._identities[position]] = position
+        self._stale_from = None
+
+
+class VirtualListbox(tk.Frame):
+    """A Listbox look-alike that materialises only the visible rows
+
+    Indices passed to and returned from the public methods are absolute
+    positions in the underlying list, mirroring the tk.Listbox API used by the
+    app (curselection, selection_set, selection_clear, see). Selecting a row
+    fires <<ListboxSelect>> on this widget.
+    """
+
+    def __init__(self, parent, row_text, scrollbar_options=None, **listbox_options):
+        super().__init__(parent, bg=listbox_options.get('bg'))
+        self.row_text = row_text
+        self.count = 0
+        self.top = 0
+        self.rows = 1
+        self.selected = None
+
+        self.listbox = tk.Listbox(self, exportselection=False, **listbox_options)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.scrollbar = tk.Scrollbar(self, command=self.yview, **(scrollbar_options or {}))
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.line_height = tkfont.Font(font=self.listbox['font']).metrics('linespace') + 1
+
+        self.listbox.bind('<Configure>', self.on_resize)
+        self.listbox.bind('<<ListboxSelect>>', self.on_row_select)
+        self.listbox.bind('<Up>', lambda e: self.step_selection(-1))
+        self.listbox.bind('<Down>', lambda e: self.step_selection(1))
+        self.listbox.bind('<MouseWheel>', self.on_mousewheel)
+        self.listbox.bind('<Button-4>', lambda e: self.scroll_by(-3))
+        self.listbox.bind('<Button-5>', lambda e: self.scroll_by(3))
+
+    # Listbox-compatible API (absolute indices)
+
+    def curselection(self):
+        return (self.selected,) if self.selected is not None else ()
+
+    def selection_set(self, index):
+        self.selected = index
+        self.listbox.selection_clear(0, tk.END)
+        row = index - self.top
+        if 0 <= row < self.listbox.size():
+            self.listbox.selection_set(row)
+
+    def selection_clear(self, first=0, last=None):
+        self.selected = None
+        self.listbox.selection_clear(0, tk.END)
+
+    def see(self, index):
+        """Scroll so that index is visible"""
+        top = self.top
+        if index < top:
+            top = index
+        elif index >= top + self.rows:
+            top = index - self.rows + 1
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    # Updates
+
+    def set_count(self, count):
+        """Set the number of rows and redraw the visible ones"""
+        self.count = count
+        if self.selected is not None and self.selected >= count:
+            self.selected = None
+        self.render()
+
+    def refresh_rows(self, *indices):
+        """Redraw specific rows, if they are on screen"""
+        for index in indices:
+            row = index - self.top
+            if 0 <= row < self.listbox.size():
+                self.listbox.delete(row)
+                self.listbox.insert(row, self.row_text(index))
+                if index == self.selected:
+                    self.listbox.selection_set(row)
+
+    def render(self):
+        """Rebuild the on-screen rows from the current scroll position"""
+        self.top = max(0, min(self.top, self.count - self.rows))
+        last = min(self.count, self.top + self.rows)
+
+        self.listbox.delete(0, tk.END)
+        for index in range(self.top, last):
+            self.listbox.insert(tk.END, self.row_text(index))
+        if self.selected is not None and self.top <= self.selected < last:
+            self.listbox.selection_set(self.selected - self.top)
+
+        if self.count:
+            self.scrollbar.set(self.top / self.count, last / self.count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    # Event handlers
+
+    def on_resize(self, event):
+        rows = max(1, event.height // self.line_height)
+        if rows != self.rows:
+            self.rows = rows
+            self.render()
+
+    def on_row_select(self, event):
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.top + selection[0]
+            self.event_generate('<<ListboxSelect>>')
+
+    def step_selection(self, delta):
+        if not self.count:
+            return "break"
+        if self.selected is None:
+            index = self.top
+        else:
+            index = max(0, min(self.count - 1, self.selected + delta))
+        self.selection_set(index)
+        self.see(index)
+        self.event_generate('<<ListboxSelect>>')
+        return "break"
+
+    def on_mousewheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self.scroll_by(-3 * delta)
+        return "break"
+
+    def scroll_by(self, rows):
+        self.top += rows
+        self.render()
+        return "break"
+
+    def yview(self, *args):
+        """Scrollbar callback"""
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * self.count)
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            self.top += amount * self.rows if args[2] == 'pages' else amount
+        self.render()
@@ -0,0 +1,257 @@
+"""
+Per-page and per-job instrumentation for Image to PDF Converter
+Each page carries a PageStats record of how long every stage took (wall and
+CPU time), how many bytes it read and wrote and the peak memory of the
+process that encoded it. A JobReport collects them, adds job totals, calls
+any registered hooks and can be saved as JSON.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stages in pipeline order, for stable report output
+STAGES = ('hash', 'cache', 'open', 'seek', 'decode', 'resize', 'classify', 'encode', 'write', 'save')
+
+
+def peak_rss_bytes(children=False):
+    """Peak resident set size of this process (and its finished children), if known"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if children:
+        usage = max(usage, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, macOS bytes
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+class PageStats:
+    """Timings and byte counts for one page
+
+    source says where the page data came from: 'encoded', 'passthrough'
+    (source JPEG embedded as-is), 'cache' (page cache hit) or 'shared'
+    (repeat of an image already in the file).
+    """
+
+    def __init__(self, image_file, frame=None):
+        self.image_file = image_file
+        # Index of the frame in a multi-frame file, None for single images
+        self.frame = frame
+        self.source = 'encoded'
+        self.kind = None
+        self.filter_name = None
+        # stage -> [wall seconds, CPU seconds]
+        self.stages = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss_bytes = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as one stage (thread CPU time, so pool threads don't mix)"""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def add_stage(self, name, wall, cpu):
+        totals = self.stages.setdefault(name, [0.0, 0.0])
+        totals[0] += wall
+        totals[1] += cpu
+
+    def merge(self, other):
+        """Fold in stats recorded for the same page elsewhere (e.g. in a worker process)"""
+        for name, (wall, cpu) in other.stages.items():
+            self.add_stage(name, wall, cpu)
+        self.bytes_read += other.bytes_read
+        self.source = other.source
+        self.kind = other.kind or self.kind
+        self.filter_name = other.filter_name or self.filter_name
+        if other.peak_rss_bytes is not None:
+            self.peak_rss_bytes = max(self.peak_rss_bytes or 0, other.peak_rss_bytes)
+
+    def to_dict(self):
+        return {
+            'image': self.image_file,
+            'frame': self.frame,
+            'source': self.source,
+            'kind': self.kind,
+            'filter': self.filter_name,
+            'stages': {
+                name: {'wall_seconds': round(wall, 6), 'cpu_seconds': round(cpu, 6)}
+                for name, (wall, cpu) in sorted(self.stages.items(), key=stage_order)
+            },
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'peak_rss_bytes': self.peak_rss_bytes,
+        }
+
+
+def stage_order(item):
+    name = item[0]
+    return (STAGES.index(name) if name in STAGES else len(STAGES), name)
+
+
+class JobReport:
+    """Collects PageStats for a conversion job and summarises them
+
+    Hooks are called as hook(event, data): ('page', page dict) after each
+    page is written, ('skip', {'image', 'reason'}) for each image left out
+    and ('job', summary dict) when the job ends. A hook that
+    raises is reported with a warning and does not stop the conversion.
+    Pages may be added from several threads (split jobs write parts
+    concurrently).
+    """
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.details = {}
+        self.pages = []
+        self.skipped = []
+        self.job_stages = {}
+        self.status = None
+        self.error = None
+        self.output_files = []
+        self._lock = threading.Lock()
+        self._started = None
+        self._cpu_started = None
+        self._wall = None
+        self._cpu = None
+
+    @property
+    def running(self):
+        return self._started is not None and self.status is None
+
+    def add_hook(self, hook):
+        """Register a callable receiving (event, data)"""
+        self.hooks.append(hook)
+
+    def start(self, **details):
+        """Mark the start of the job; details (settings, input count) go into the report"""
+        self.details = details
+        self._started = time.perf_counter()
+        self._cpu_started = process_cpu_seconds()
+
+    def add_page(self, stats):
+        with self._lock:
+            self.pages.append(stats)
+        self._call_hooks('page', stats.to_dict())
+
+    def add_skipped(self, image_file, reason):
+        skipped = {'image': image_file, 'reason': reason}
+        with self._lock:
+            self.skipped.append(skipped)
+        self._call_hooks('skip', skipped)
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as a job-level stage"""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add_job_stage(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def add_job_stage(self, name, wall, cpu):
+        """Record time spent outside any single page (e.g. the final save)"""
+        with self._lock:
+            totals = self.job_stages.setdefault(name, [0.0, 0.0])
+            totals[0] += wall
+            totals[1] += cpu
+
+    def finish(self, status, output_files=(), error=None):
+        """Mark the end of the job ('ok', 'cancelled' or 'failed') and call the job hooks"""
+        self._wall = time.perf_counter() - self._started
+        self._cpu = process_cpu_seconds() - self._cpu_started
+        self.status = status
+        self.error = None if error is None else (str(error) or type(error).__name__)
+        self.output_files = list(output_files)
+        self._call_hooks('job', self.summary())
+
+    def summary(self):
+        """Job totals, without the per-page records"""
+        stages = {}
+        for stats in self.pages:
+            for name, (wall, cpu) in stats.stages.items():
+                totals = stages.setdefault(name, [0.0, 0.0])
+                totals[0] += wall
+                totals[1] += cpu
+        for name, (wall, cpu) in self.job_stages.items():
+            totals = stages.setdefault(name, [0.0, 0.0])
+            totals[0] += wall
+            totals[1] += cpu
+
+        peaks = [stats.peak_rss_bytes for stats in self.pages if stats.peak_rss_bytes is not None]
+        own_peak = peak_rss_bytes()
+        if own_peak is not None:
+            peaks.append(own_peak)
+
+        output_bytes = 0
+        for path in self.output_files:
+            try:
+                output_bytes += os.path.getsize(path)
+            except OSError:
+                pass
+
+        wall = self._wall
+        return {
+            'status': self.status,
+            'error': self.error,
+            'details': self.details,
+            'pages': len(self.pages),
+            'skipped': self.skipped,
+            'wall_seconds': round(wall, 6) if wall is not None else None,
+            'cpu_seconds': round(self._cpu, 6) if self._cpu is not None else None,
+            'pages_per_second': round(len(self.pages) / wall, 3) if wall else None,
+            'stages': {
+                name: {'wall_seconds': round(wall, 6), 'cpu_seconds': round(cpu, 6)}
+                for name, (wall, cpu) in sorted(stages.items(), key=stage_order)
+            },
+            'sources': count_by(stats.source for stats in self.pages),
+            'bytes_read': sum(stats.bytes_read for stats in self.pages),
+            'bytes_written': sum(stats.bytes_written for stats in self.pages),
+            'output_files': self.output_files,
+            'output_bytes': output_bytes,
+            'peak_rss_bytes': max(peaks) if peaks else None,
+        }
+
+    def to_dict(self):
+        report = self.summary()
+        report['page_stats'] = [stats.to_dict() for stats in self.pages]
+        return report
+
+    def write(self, path):
+        """Save the full report (summary and every page) as JSON"""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+            f.write("\n")
+
+    def _call_hooks(self, event, data):
+        for hook in self.hooks:
+            try:
+                hook(event, data)
+            except Exception as e:
+                warnings.warn(f"report hook {hook!r} failed: {e}")
+
+
+def process_cpu_seconds():
+    """CPU time of this process and its finished children (the encoder pool)"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def count_by(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return counts
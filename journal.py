@@ -0,0 +1,112 @@
+"""
+Checkpoint journal for Image to PDF Converter
+While a PDF is written, one JSON line per finished input image records what
+went into the partial file (pdf_writer.PDFWriter.checkpoint()) or why the
+image was skipped. If the job dies, a rerun with the same images (unchanged
+on disk) and settings reads the journal back and carries on after the last
+finished page instead of starting over.
+"""
+
+import hashlib
+import json
+import os
+
+# Written next to the output file while the job runs
+JOURNAL_SUFFIX = ".journal"
+
+JOURNAL_VERSION = 2
+
+
+def file_stamp(path):
+    """Size and mtime of a file, so an input edited in place starts the job over"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def job_key(image_files, settings):
+    """Identify a job by its inputs (in order, with their stamps) and encoding settings
+
+    image_files holds paths or (path, frame) pairs, as convert_images uses them.
+    """
+    image_files = list(image_files)
+    stamps = {}
+    for item in image_files:
+        path = item if isinstance(item, str) else item[0]
+        if path not in stamps:
+            stamps[path] = file_stamp(path)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([JOURNAL_VERSION, settings, image_files, stamps],
+                             sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ConversionJournal:
+    """Append-only record of the pages finished so far
+
+    Entries are flushed as they are written, so the journal survives the
+    process being killed; a line torn by the crash is ignored on reload.
+    """
+
+    def __init__(self, output_file):
+        self.path = output_file + JOURNAL_SUFFIX
+        self._file = None
+        # Length of the journal up to its last complete entry
+        self._valid_size = 0
+
+    def load(self, key):
+        """Return the entries of an earlier run of the same job, or [] if there is none"""
+        entries = []
+        try:
+            with open(self.path, "rb") as f:
+                header = f.readline()
+                if not header.endswith(b"\n") or json.loads(header).get("job") != key:
+                    return []
+                size = len(header)
+                for line in f:
+                    try:
+                        entry = json.loads(line) if line.endswith(b"\n") else None
+                    except ValueError:
+                        entry = None
+                    if not isinstance(entry, dict) or entry.get("index") != len(entries):
+                        break
+                    entries.append(entry)
+                    size += len(line)
+        except (OSError, ValueError, AttributeError):
+            return []
+        self._valid_size = size
+        return entries
+
+    def start(self, key, resume=False):
+        """Open the journal for writing: a new one, or the loaded one after its last entry"""
+        if resume:
+            self._file = open(self.path, "r+b")
+            self._file.truncate(self._valid_size)
+            self._file.seek(self._valid_size)
+        else:
+            self._file = open(self.path, "wb")
+            self._write({"version": JOURNAL_VERSION, "job": key})
+
+    def record(self, index, image_file, checkpoint, skipped=None):
+        """Note that input index is finished: written (checkpoint) or skipped (reason)"""
+        self._write({"index": index, "image": image_file, "skipped": skipped,
+                     "checkpoint": checkpoint})
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Close and delete the journal, once the job has finished or been cancelled"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -1,13 +1,65 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
+from PIL import ImageTk
 import os
 import subprocess
 import platform
+import queue
+import threading
 from pathlib import Path
 
+from file_list import IndexedFileSet, VirtualListbox
+from engine import ConversionCancelled, convert_images, convert_images_split
+from pdf_writer import COMPRESSION_PROFILES, DEFAULT_DPI, PageLayout
+from scanner import probe_images, scan_directory
+from journal import JOURNAL_SUFFIX
+from sort_index import SortIndex
+from disk_cache import DiskCache, PageCache
+from thumbnails import PREFETCH_RADIUS, ThumbnailCache, ThumbnailPrefetcher, cache_key
+
+# How often the UI picks up progress from the conversion worker
+PROGRESS_POLL_MS = 100
+
+# How often the UI picks up thumbnails decoded in the background
+PREVIEW_POLL_MS = 50
+
+# How often the UI adds files found by a folder scan
+INGEST_POLL_MS = 100
+
+# Page size choices shown in the UI, mapped to pdf_writer.PAGE_SIZES keys
+PAGE_SIZE_CHOICES = {'Image size': None, 'A4': 'a4', 'Letter': 'letter'}
+
+# Output resolutions offered for fixed page sizes
+DPI_CHOICES = ('72', '100', '150', '200', '300')
+
+# Split choices shown in the UI, as keyword arguments for convert_images_split
+SPLIT_CHOICES = {
+    'Single PDF': None,
+    'Every 100 pages': {'max_pages': 100},
+    'Every 500 pages': {'max_pages': 500},
+    'Max 25 MB': {'max_bytes': 25 * 1024 * 1024},
+    'Max 100 MB': {'max_bytes': 100 * 1024 * 1024},
+}
+
+# Which frames of multi-page TIFF and animated GIF/WebP files become pages
+FRAME_CHOICES = {'All frames': None, 'First frame': [(1, 1)]}
+
+# Sort menu entries, mapped to sort_index.SORT_ORDERS keys
+SORT_CHOICES = {
+    '🔢 Name (natural: 2 before 10)': 'natural',
+    '🔤 Name (alphabetical)': 'name',
+    '📷 Date taken (EXIF)': 'taken',
+    '🕒 Date modified': 'mtime',
+    '📦 File size': 'size',
+    '📐 Dimensions': 'dimensions',
+}
+
+# Compression choices shown in the UI, mapped to pdf_writer.COMPRESSION_PROFILES keys
+COMPRESSION_CHOICES = {'Automatic': 'auto', 'Photo (JPEG)': 'photo', 'Compact': 'compact'}
+
+
 class ImageToPDFConverter:
-    def __init__(self, root):
+    def __init__(self, root, workers=None):
         self.root = root
         self.root.title("✨ Image to PDF Converter Pro")
         self.root.geometry("1100x750")
@@ -29,11 +81,40 @@ class ImageToPDFConverter:
         }
         
         # Store selected images and thumbnails
-        self.image_files = []
-        self.thumbnails = {}
+        self.image_files = IndexedFileSet()
+        # Per-file list details (size, dimensions), computed once when a row is first shown
+        self.file_details = {}
+        # Files a folder scan found to be unreadable (path -> reason)
+        self.file_problems = {}
+        # Previews and image details persist across sessions in the user cache directory
+        self.disk_cache = DiskCache.open_default()
+        self.thumbnails = ThumbnailCache(disk_cache=self.disk_cache)
+        # Encoded pages too, opened once the page cache option is first used
+        self.page_cache = None
+        self.prefetcher = ThumbnailPrefetcher(self.thumbnails)
+        self.preview_path = None
+        # Sort keys (dates, sizes, dimensions) read once per file, so re-sorting stays in memory
+        self.sort_index = SortIndex()
+        self.sort_thread = None
+        
+        # Number of processes used to decode and encode pages (None = one per CPU)
+        self.workers = workers
+        
+        # Background folder scan state
+        self.ingest_queue = queue.Queue()
+        self.ingest_generation = 0
+        self.ingest_cancel = threading.Event()
+        
+        # Background conversion state (the worker reports through the queue)
+        self.conversion_thread = None
+        self.progress_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.close_requested = False
         
         self.setup_styles()
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(PREVIEW_POLL_MS, self.poll_thumbnails)
         
     def setup_styles(self):
         """Configure modern ttk styles"""
@@ -126,6 +207,16 @@ class ImageToPDFConverter:
         )
         self.select_btn.pack(side=tk.LEFT, padx=(0, 15))
         
+        # Add folder button (recursive scan)
+        self.folder_btn = self.create_modern_button(
+            inner_frame,
+            text="📂 Add Folder",
+            command=self.add_folder,
+            bg_color=self.colors['success'],
+            hover_color='#229954'
+        )
+        self.folder_btn.pack(side=tk.LEFT, padx=(0, 15))
+        
         # Clear selection button
         self.clear_btn = self.create_modern_button(
             inner_frame,
@@ -145,7 +236,154 @@ class ImageToPDFConverter:
             hover_color=self.colors['accent_hover'],
             state=tk.DISABLED
         )
-        self.convert_btn.pack(side=tk.LEFT)
+        self.convert_btn.pack(side=tk.LEFT, padx=(0, 15))
+        
+        # Cancel button (active only while a conversion is running)
+        self.cancel_btn = self.create_modern_button(
+            inner_frame,
+            text="⛔ Cancel",
+            command=self.cancel_conversion,
+            bg_color=self.colors['warning'],
+            hover_color='#e67e22',
+            state=tk.DISABLED
+        )
+        self.cancel_btn.config(bg=self.colors['border'])
+        self.cancel_btn.pack(side=tk.LEFT)
+        
+        # Output options: page size and resolution
+        options_frame = tk.Frame(button_card, bg=self.colors['bg_card'])
+        options_frame.pack(padx=25, pady=(0, 15))
+        
+        tk.Label(
+            options_frame,
+            text="📐 Page size:",
+            font=("Segoe UI", 10),
+            bg=self.colors['bg_card'],
+            fg=self.colors['text_secondary']
+        ).pack(side=tk.LEFT, padx=(0, 8))
+        self.page_size_var = tk.StringVar(value='Image size')
+        self.page_size_box = ttk.Combobox(
+            options_frame,
+            textvariable=self.page_size_var,
+            values=list(PAGE_SIZE_CHOICES),
+            state='readonly',
+            width=12
+        )
+        self.page_size_box.pack(side=tk.LEFT, padx=(0, 20))
+        self.page_size_box.bind('<<ComboboxSelected>>', self.on_page_size_change)
+        
+        tk.Label(
+            options_frame,
+            text="🔍 DPI:",
+            font=("Segoe UI", 10),
+            bg=self.colors['bg_card'],
+            fg=self.colors['text_secondary']
+        ).pack(side=tk.LEFT, padx=(0, 8))
+        self.dpi_var = tk.StringVar(value=str(DEFAULT_DPI))
+        self.dpi_box = ttk.Combobox(
+            options_frame,
+            textvariable=self.dpi_var,
+            values=DPI_CHOICES,
+            state=tk.DISABLED,
+            width=6
+        )
+        self.dpi_box.pack(side=tk.LEFT, padx=(0, 20))
+        
+        tk.Label(
+            options_frame,
+            text="🗜️ Compression:",
+            font=("Segoe UI", 10),
+            bg=self.colors['bg_card'],
+            fg=self.colors['text_secondary']
+        ).pack(side=tk.LEFT, padx=(0, 8))
+        self.compression_var = tk.StringVar(value='Automatic')
+        self.compression_box = ttk.Combobox(
+            options_frame,
+            textvariable=self.compression_var,
+            values=list(COMPRESSION_CHOICES),
+            state='readonly',
+            width=13
+        )
+        self.compression_box.pack(side=tk.LEFT, padx=(0, 20))
+        
+        self.append_var = tk.BooleanVar(value=False)
+        self.append_check = tk.Checkbutton(
+            options_frame,
+            text="➕ Append to existing PDF",
+            variable=self.append_var,
+            font=("Segoe UI", 10),
+            bg=self.colors['bg_card'],
+            fg=self.colors['text_secondary'],
+            selectcolor=self.colors['bg_secondary'],
+            activebackground=self.colors['bg_card'],
+            activeforeground=self.colors['text_primary'],
+            highlightthickness=0,
+            bd=0
+        )
+        self.append_check.pack(side=tk.LEFT, padx=(0, 20))
+        
+        tk.Label(
+            options_frame,
+            text="✂️ Split:",
+            font=("Segoe UI", 10),
+            bg=self.colors['bg_card'],
+            fg=self.colors['text_secondary']
+        ).pack(side=tk.LEFT, padx=(0, 8))
+        self.split_var = tk.StringVar(value='Single PDF')
+        self.split_box = ttk.Combobox(
+            options_frame,
+            textvariable=self.split_var,
+            values=list(SPLIT_CHOICES),
+            state='readonly',
+            width=15
+        )
+        self.split_box.pack(side=tk.LEFT, padx=(0, 20))
+        
+        tk.Label(
+            options_frame,
+            text="🎞️ Frames:",
+            font=("Segoe UI", 10),
+            bg=self.colors['bg_card'],
+            fg=self.colors['text_secondary']
+        ).pack(side=tk.LEFT, padx=(0, 8))
+        self.frames_var = tk.StringVar(value='All frames')
+        self.frames_box = ttk.Combobox(
+            options_frame,
+            textvariable=self.frames_var,
+            values=list(FRAME_CHOICES),
+            state='readonly',
+            width=11
+        )
+        self.frames_box.pack(side=tk.LEFT, padx=(0, 20))
+        
+        self.cache_var = tk.BooleanVar(value=False)
+        self.cache_check = tk.Checkbutton(
+            options_frame,
+            text="♻️ Reuse encoded pages",
+            variable=self.cache_var,
+            font=("Segoe UI", 10),
+            bg=self.colors['bg_card'],
+            fg=self.colors['text_secondary'],
+            selectcolor=self.colors['bg_secondary'],
+            activebackground=self.colors['bg_card'],
+            activeforeground=self.colors['text_primary'],
+            highlightthickness=0,
+            bd=0
+        )
+        self.cache_check.pack(side=tk.LEFT)
+        
+    def on_page_size_change(self, event=None):
+        """DPI only applies when pages have a fixed size"""
+        fixed = PAGE_SIZE_CHOICES[self.page_size_var.get()] is not None
+        self.dpi_box.config(state='readonly' if fixed else tk.DISABLED)
+        
+    def page_layout(self):
+        """Build the PageLayout chosen in the output options"""
+        return PageLayout(PAGE_SIZE_CHOICES[self.page_size_var.get()], int(self.dpi_var.get()))
+        
+    def compression_profile(self):
+        """The CompressionProfile chosen in the output options"""
+        return COMPRESSION_PROFILES[COMPRESSION_CHOICES[self.compression_var.get()]]
         
     def create_modern_button(self, parent, text, command, bg_color, hover_color, state=tk.NORMAL):
         """Create a modern button with hover effects"""
@@ -235,9 +473,18 @@ class ImageToPDFConverter:
         listbox_container = tk.Frame(content_frame, bg=self.colors['bg_card'])
         listbox_container.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
-        # Modern listbox
-        self.listbox = tk.Listbox(
+        # Modern listbox (virtualized: only the visible rows are materialised)
+        self.listbox = VirtualListbox(
             listbox_container,
+            row_text=self.file_row_text,
+            scrollbar_options={
+                'bg': self.colors['bg_secondary'],
+                'troughcolor': self.colors['bg_secondary'],
+                'activebackground': self.colors['accent'],
+                'relief': tk.FLAT,
+                'bd': 0,
+                'width': 12
+            },
             font=("Segoe UI", 10),
             bg=self.colors['bg_secondary'],
             fg=self.colors['text_primary'],
@@ -248,26 +495,11 @@ class ImageToPDFConverter:
             highlightthickness=0,
             activestyle='none'
         )
-        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.listbox.pack(fill=tk.BOTH, expand=True)
         
         # Bind selection event for thumbnail preview
         self.listbox.bind('<<ListboxSelect>>', self.on_file_select)
         
-        # Modern scrollbar
-        scrollbar = tk.Scrollbar(
-            listbox_container,
-            bg=self.colors['bg_secondary'],
-            troughcolor=self.colors['bg_secondary'],
-            activebackground=self.colors['accent'],
-            relief=tk.FLAT,
-            bd=0,
-            width=12
-        )
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        self.listbox.config(yscrollcommand=scrollbar.set)
-        scrollbar.config(command=self.listbox.yview)
-        
         # Control buttons for reordering
         control_frame = tk.Frame(content_frame, bg=self.colors['bg_card'])
         control_frame.pack(side=tk.RIGHT, fill=tk.Y, padx=(15, 0))
@@ -314,16 +546,29 @@ class ImageToPDFConverter:
         separator = tk.Frame(control_frame, bg=self.colors['text_secondary'], height=1)
         separator.pack(fill=tk.X, pady=(0, 15))
         
-        # Auto-sort button
+        # Sort button, opening a menu of orders
         self.sort_btn = self.create_control_button(
             control_frame,
             text="🔤",
-            command=self.sort_alphabetically,
-            tooltip="Sort alphabetically",
+            command=self.show_sort_menu,
+            tooltip="Sort images",
             bg_color=self.colors['success']
         )
         self.sort_btn.pack()
         
+        self.sort_menu = tk.Menu(
+            self.root,
+            tearoff=0,
+            bg=self.colors['bg_secondary'],
+            fg=self.colors['text_primary'],
+            activebackground=self.colors['accent'],
+            activeforeground=self.colors['text_primary']
+        )
+        for label, order in SORT_CHOICES.items():
+            self.sort_menu.add_command(label=label, command=lambda order=order: self.sort_images(order))
+        self.sort_menu.add_separator()
+        self.sort_menu.add_command(label="🔃 Reverse order", command=self.reverse_order)
+        
     def create_control_button(self, parent, text, command, tooltip="", bg_color=None):
         """Create a small control button for reordering"""
         if bg_color is None:
@@ -463,29 +708,75 @@ class ImageToPDFConverter:
         if selection:
             index = selection[0]
             if index < len(self.image_files):
-                self.show_thumbnail(self.image_files[index])
+                image_path = self.image_files[index]
+                self.show_thumbnail(image_path)
+                # Decode in the background, then warm the cache around the selection
+                self.prefetcher.request(image_path, self.neighbour_files(index))
                 # Update status with current selection info
-                filename = os.path.basename(self.image_files[index])
+                filename = os.path.basename(image_path)
                 self.status_label.config(text=f"📷 Viewing: {filename} ({index+1}/{len(self.image_files)})")
         else:
             self.clear_thumbnail()
             
+    def neighbour_files(self, index):
+        """Images around index, nearest first, alternating below and above"""
+        neighbours = []
+        for distance in range(1, PREFETCH_RADIUS + 1):
+            for i in (index + distance, index - distance):
+                if 0 <= i < len(self.image_files):
+                    neighbours.append(self.image_files[i])
+        return neighbours
+        
     def show_thumbnail(self, image_path):
-        """Display thumbnail for selected image"""
+        """Display thumbnail for selected image, or a placeholder until it is decoded"""
+        self.preview_path = image_path
+        try:
+            # Served from the LRU cache unless the file is new or has changed
+            thumbnail = self.thumbnails.get(cache_key(image_path))
+        except OSError:
+            self.display_thumbnail(image_path, None)
+            return
+            
+        if thumbnail is not None:
+            self.display_thumbnail(image_path, thumbnail)
+            return
+            
+        for widget in self.thumbnail_frame.winfo_children():
+            widget.destroy()
+            
+        loading_label = tk.Label(
+            self.thumbnail_frame,
+            text=f"⏳ Loading preview\n{os.path.basename(image_path)}",
+            font=("Segoe UI", 10),
+            bg=self.colors['bg_card'],
+            fg=self.colors['text_secondary'],
+            justify=tk.CENTER
+        )
+        loading_label.pack(expand=True)
+        
+    def poll_thumbnails(self):
+        """Show thumbnails finished by the prefetcher without blocking the UI"""
+        try:
+            while True:
+                image_path, thumbnail = self.prefetcher.results.get_nowait()
+                if image_path == self.preview_path:
+                    self.display_thumbnail(image_path, thumbnail)
+        except queue.Empty:
+            pass
+        self.root.after(PREVIEW_POLL_MS, self.poll_thumbnails)
+        
+    def display_thumbnail(self, image_path, thumbnail):
+        """Render a decoded thumbnail (or an error if it could not be decoded)"""
         try:
             # Clear previous thumbnail
             for widget in self.thumbnail_frame.winfo_children():
                 widget.destroy()
                 
-            # Load and resize image
-            img = Image.open(image_path)
-            
-            # Calculate thumbnail size maintaining aspect ratio
-            max_size = (250, 250)
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
+            if thumbnail is None:
+                raise ValueError(f"cannot decode {image_path}")
+                
             # Convert to PhotoImage
-            photo = ImageTk.PhotoImage(img)
+            photo = ImageTk.PhotoImage(thumbnail.image)
             
             # Store reference to prevent garbage collection
             self.current_thumbnail = photo
@@ -502,12 +793,8 @@ class ImageToPDFConverter:
             
             # Display image info
             filename = os.path.basename(image_path)
-            file_size = os.path.getsize(image_path)
-            size_str = self.format_file_size(file_size)
-            
-            # Get image dimensions
-            original_img = Image.open(image_path)
-            width, height = original_img.size
+            size_str = self.format_file_size(thumbnail.file_size)
+            width, height = thumbnail.width, thumbnail.height
             
             info_text = f"{filename}\n{width} × {height} pixels\n{size_str}"
             
@@ -536,6 +823,7 @@ class ImageToPDFConverter:
             
     def clear_thumbnail(self):
         """Clear thumbnail display"""
+        self.preview_path = None
         for widget in self.thumbnail_frame.winfo_children():
             widget.destroy()
             
@@ -576,17 +864,110 @@ class ImageToPDFConverter:
         )
         
         if files:
-            # Add new files to existing selection
-            for file in files:
-                if file not in self.image_files:
-                    self.image_files.append(file)
+            # Add new files to existing selection (the same file is only added once)
+            self.image_files.extend(files)
             
             self.update_file_list()
             self.update_convert_button()
             
+    def add_folder(self):
+        """Scan a folder (and its subfolders) for images in the background"""
+        directory = filedialog.askdirectory(title="📂 Select a Folder of Images")
+        if not directory:
+            return
+            
+        self.stop_ingest()
+        self.ingest_cancel = threading.Event()
+        self.ingest_stats = {'added': 0, 'unreadable': 0}
+        self.folder_btn.config(state=tk.DISABLED)
+        self.status_label.config(text=f"📂 Scanning {os.path.basename(directory) or directory}...")
+        
+        threading.Thread(
+            target=self.run_ingest,
+            args=(directory, self.ingest_generation, self.ingest_cancel),
+            daemon=True
+        ).start()
+        self.root.after(INGEST_POLL_MS, self.poll_ingest, self.ingest_generation)
+        
+    def run_ingest(self, directory, generation, cancel_event):
+        """Worker thread: walk the folder and probe headers in parallel, posting batches"""
+        try:
+            for batch in probe_images(scan_directory(directory), cancel_event=cancel_event):
+                for info in batch:
+                    # Record details so list rows and later sessions skip the probe
+                    if info.ok:
+                        try:
+                            key = cache_key(info.path)
+                        except OSError:
+                            continue
+                        if self.disk_cache.get_metadata(key) is None:
+                            self.disk_cache.put(key, info.metadata)
+                self.ingest_queue.put((generation, 'batch', batch))
+        except Exception as e:
+            self.ingest_queue.put((generation, 'error', str(e)))
+        self.ingest_queue.put((generation, 'done', directory))
+        
+    def poll_ingest(self, generation):
+        """Add scanned files to the list in batches, keeping the UI responsive"""
+        if generation != self.ingest_generation:
+            return  # the scan was stopped
+            
+        finished = None
+        added = False
+        try:
+            while True:
+                message_generation, kind, payload = self.ingest_queue.get_nowait()
+                if message_generation != generation:
+                    continue  # left over from a scan that was stopped
+                if kind == 'batch':
+                    for info in payload:
+                        if not self.image_files.add(info.path):
+                            continue
+                        added = True
+                        if info.ok:
+                            self.ingest_stats['added'] += 1
+                        else:
+                            self.ingest_stats['unreadable'] += 1
+                            self.file_problems[info.path] = info.error
+                else:
+                    finished = (kind, payload)
+        except queue.Empty:
+            pass
+            
+        if added:
+            self.update_file_list()
+            self.update_convert_button()
+            
+        stats = self.ingest_stats
+        if finished is None:
+            self.status_label.config(text=f"📂 Scanning... {stats['added']} added, {stats['unreadable']} unreadable")
+            self.root.after(INGEST_POLL_MS, self.poll_ingest, generation)
+            return
+            
+        if not self.is_converting():
+            self.folder_btn.config(state=tk.NORMAL)
+        if finished[0] == 'error':
+            messagebox.showerror("❌ Error", f"Could not scan the folder:\n\n{finished[1]}")
+        summary = f"📂 Added {stats['added']} image{'s' if stats['added'] != 1 else ''}"
+        if stats['unreadable']:
+            summary += f" - ⚠️ {stats['unreadable']} unreadable file{'s' if stats['unreadable'] != 1 else ''} flagged"
+        self.status_label.config(text=summary)
+        
+    def stop_ingest(self):
+        """Stop a running folder scan and ignore anything it still reports"""
+        self.ingest_cancel.set()
+        self.ingest_generation += 1
+        if not self.is_converting():
+            self.folder_btn.config(state=tk.NORMAL)
+            
     def clear_selection(self):
         """Clear all selected images"""
+        self.stop_ingest()
         self.image_files.clear()
+        self.file_details.clear()
+        self.file_problems.clear()
+        self.sort_index.clear()
+        self.prefetcher.cancel()
         self.thumbnails.clear()
         self.update_file_list()
         self.update_convert_button()
@@ -594,22 +975,35 @@ class ImageToPDFConverter:
         self.status_label.config(text="🧹 Selection cleared - Ready for new images")
         
     def update_file_list(self):
-        """Update the listbox with selected files"""
-        self.listbox.delete(0, tk.END)
-        for i, file in enumerate(self.image_files, 1):
-            filename = os.path.basename(file)
-            # Add file size info
-            try:
-                size = os.path.getsize(file)
-                size_str = self.format_file_size(size)
-                display_text = f"{i:2d}. {filename} ({size_str})"
-            except:
-                display_text = f"{i:2d}. {filename}"
-            self.listbox.insert(tk.END, display_text)
+        """Update the listbox with selected files (only visible rows are redrawn)"""
+        self.listbox.set_count(len(self.image_files))
             
         # Update file count
         count = len(self.image_files)
         self.file_count_label.config(text=f"{count} file{'s' if count != 1 else ''}")
+        
+    def file_row_text(self, index):
+        """Listbox text for one row, using details looked up once per file"""
+        file = self.image_files[index]
+        if file in self.file_problems:
+            return f"{index+1:2d}. ⚠️ {os.path.basename(file)} (unreadable: {self.file_problems[file]})"
+        details = self.file_details.get(file)
+        if details is None:
+            details = self.describe_file(file)
+            self.file_details[file] = details
+        return f"{index+1:2d}. {os.path.basename(file)}{details}"
+        
+    def describe_file(self, file):
+        """Size (and dimensions, if a previous session recorded them) shown after the name"""
+        try:
+            key = cache_key(file)
+        except OSError:
+            return ""
+        size_str = self.format_file_size(key[2])
+        metadata = self.disk_cache.get_metadata(key)
+        if metadata is not None:
+            return f" ({metadata['width']}×{metadata['height']}, {size_str})"
+        return f" ({size_str})"
             
     def format_file_size(self, size_bytes):
         """Format file size in human readable format"""
@@ -642,72 +1036,228 @@ class ImageToPDFConverter:
             messagebox.showwarning("⚠️ No Images", "Please select images first!")
             return
             
-        # Ask for output file location
-        output_file = filedialog.asksaveasfilename(
-            title="💾 Save PDF as",
-            defaultextension=".pdf",
-            filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
-        )
+        if self.is_converting():
+            return
+            
+        # Files flagged by a folder scan would only fail halfway through
+        image_files = [f for f in self.image_files if f not in self.file_problems]
+        if len(image_files) < len(self.image_files):
+            skipped = len(self.image_files) - len(image_files)
+            if not image_files:
+                messagebox.showwarning("⚠️ No Readable Images", "None of the selected files can be read as images.")
+                return
+            if not messagebox.askyesno(
+                "⚠️ Unreadable Files",
+                f"{skipped} file{'s' if skipped != 1 else ''} could not be read and will be skipped.\n\nContinue with {len(image_files)} image{'s' if len(image_files) != 1 else ''}?"
+            ):
+                return
+                
+        # Ask for output file location (an existing PDF when appending)
+        append = self.append_var.get()
+        split = SPLIT_CHOICES[self.split_var.get()]
+        if append and split:
+            messagebox.showwarning("⚠️ Append and Split", "Appending to an existing PDF can't be combined with splitting the output.")
+            return
+        if append:
+            output_file = filedialog.askopenfilename(
+                title="➕ Append pages to PDF",
+                filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
+            )
+        else:
+            output_file = filedialog.asksaveasfilename(
+                title="💾 Save PDF as",
+                defaultextension=".pdf",
+                filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
+            )
         
         if not output_file:
             return
             
-        try:
-            self.progress.config(maximum=len(self.image_files))
-            self.progress['value'] = 0
-            self.root.update()
-            
-            # Convert images to PIL Image objects
-            images = []
-            for i, image_file in enumerate(self.image_files):
-                filename = os.path.basename(image_file)
-                self.status_label.config(text=f"🔄 Processing {filename}... ({i+1}/{len(self.image_files)})")
-                self.root.update()
-                
-                # Open and convert image
-                img = Image.open(image_file)
-                
-                # Convert to RGB if necessary (for PDF compatibility)
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                    
-                images.append(img)
-                
-                # Update progress
-                self.progress['value'] = i + 1
-                self.root.update()
+        # Stores every encode in the user cache directory, so only when asked for
+        if self.cache_var.get() and self.page_cache is None:
+            self.page_cache = PageCache.open_default()
+        page_cache = self.page_cache if self.cache_var.get() else None
+            
+        # image_files is a snapshot, so later edits can't race the worker
+        self.cancel_event.clear()
+        self.progress.config(maximum=len(image_files))
+        self.progress['value'] = 0
+        self.status_label.config(text="🔄 Starting conversion...")
+        self.set_controls_state(tk.DISABLED)
+        
+        self.conversion_thread = threading.Thread(
+            target=self.run_conversion,
+            args=(image_files, output_file, self.page_layout(), self.compression_profile(), append, split,
+                  FRAME_CHOICES[self.frames_var.get()], page_cache),
+            daemon=True
+        )
+        self.conversion_thread.start()
+        self.root.after(PROGRESS_POLL_MS, self.poll_conversion)
+        
+    def run_conversion(self, image_files, output_file, layout, profile, append=False, split=None,
+                       frames=None, page_cache=None):
+        """Worker thread: encode and write pages, reporting through the progress queue"""
+        page_total = 0
+        
+        def report(done, total, image_file):
+            nonlocal page_total
+            page_total = total
+            self.progress_queue.put(('progress', done, os.path.basename(image_file), total))
+            if done == total:
+                self.progress_queue.put(('saving',))
                 
-            # Save as PDF
-            self.status_label.config(text="💾 Saving PDF document...")
-            self.root.update()
-            
-            if images:
-                # Save the first image as PDF with the rest as additional pages
-                images[0].save(
-                    output_file,
-                    "PDF",
-                    resolution=100.0,
-                    save_all=True,
-                    append_images=images[1:] if len(images) > 1 else []
-                )
+        # Images that failed to convert; read by the UI thread only after 'done'
+        skipped = {}
+        # One entry per page left out; a multi-frame file can lose several
+        skipped_pages = []
+        
+        def skip(image_file, reason):
+            skipped[image_file] = reason
+            skipped_pages.append(image_file)
+            
+        options = dict(
+            workers=self.workers,
+            progress=report,
+            cancel_event=self.cancel_event,
+            layout=layout,
+            profile=profile,
+            page_cache=page_cache,
+            on_skip=skip,
+            frames=frames
+        )
+        try:
+            if split:
+                output_files = convert_images_split(image_files, output_file, **split, **options)
+                page_count = page_total - len(skipped_pages)
+            else:
+                page_count = convert_images(image_files, output_file, append=append, **options)
+                output_files = [output_file]
+            self.progress_queue.put(('done', output_files, page_count, skipped))
+        except ConversionCancelled:
+            # PDFWriter has already removed the partial output (or the partial update)
+            self.progress_queue.put(('cancelled',))
+        except Exception as e:
+            resumable = not split and os.path.exists(output_file + JOURNAL_SUFFIX)
+            self.progress_queue.put(('error', str(e), resumable))
+            
+    def poll_conversion(self):
+        """Apply queued worker updates to the UI at a fixed rate"""
+        progress = None
+        finished = None
+        try:
+            while True:
+                message = self.progress_queue.get_nowait()
+                if message[0] in ('progress', 'saving'):
+                    progress = message
+                else:
+                    finished = message
+        except queue.Empty:
+            pass
+            
+        if progress is not None and not self.cancel_event.is_set():
+            if progress[0] == 'progress':
+                done, filename, total = progress[1], progress[2], progress[3]
+                # Multi-frame images can make more pages than there are files
+                self.progress.config(maximum=total)
+                self.progress['value'] = done
+                self.status_label.config(text=f"🔄 Processing {filename}... ({done}/{total})")
+            else:
+                self.status_label.config(text="💾 Saving PDF document...")
                 
-            self.progress['value'] = len(self.image_files)
-            self.status_label.config(text=f"🎉 PDF created successfully: {os.path.basename(output_file)}")
+        if finished is None:
+            self.root.after(PROGRESS_POLL_MS, self.poll_conversion)
+            return
+            
+        self.conversion_thread = None
+        self.set_controls_state(tk.NORMAL)
+        self.progress['value'] = 0
+        
+        if self.close_requested:
+            self.root.destroy()
+            return
             
-            # Ask if user wants to open the PDF
+        if finished[0] == 'done':
+            output_files, page_count, skipped = finished[1], finished[2], finished[3]
+            output_file = output_files[0]
+            if len(output_files) == 1:
+                names = os.path.basename(output_file)
+            else:
+                names = f"{os.path.basename(output_file)} … {os.path.basename(output_files[-1])} ({len(output_files)} files)"
+            self.status_label.config(text=f"🎉 PDF created successfully: {names}")
+            
+            # Flag the images that were left out, as a folder scan would
+            skipped_note = ""
+            if skipped:
+                self.file_problems.update(skipped)
+                self.update_file_list()
+                shown = "\n".join(f"   • {os.path.basename(f)}" for f in list(skipped)[:5])
+                more = f"\n   … and {len(skipped) - 5} more" if len(skipped) > 5 else ""
+                skipped_note = f"\n⚠️ Skipped {len(skipped)} unreadable image{'s' if len(skipped) != 1 else ''}:\n{shown}{more}\n"
+                self.status_label.config(text=f"🎉 PDF created: {names} - ⚠️ {len(skipped)} skipped")
+            
+            # Ask if user wants to open the (first) PDF
             result = messagebox.askyesno(
                 "🎉 Success!", 
-                f"PDF created successfully!\n\n📄 File: {os.path.basename(output_file)}\n📁 Location: {os.path.dirname(output_file)}\n📊 Pages: {len(images)}\n\nWould you like to open the PDF now?"
+                f"PDF created successfully!\n\n📄 File: {names}\n📁 Location: {os.path.dirname(output_file)}\n📊 Pages: {page_count}\n{skipped_note}\nWould you like to open the PDF now?"
             )
             
             if result:
                 self.open_file(output_file)
-            
-        except Exception as e:
-            messagebox.showerror("❌ Error", f"An error occurred during conversion:\n\n{str(e)}")
+        elif finished[0] == 'cancelled':
+            self.status_label.config(text="⛔ Conversion cancelled - no PDF was written")
+        else:
+            resume_note = ""
+            if finished[2]:
+                resume_note = "\n\n💾 Progress was saved: converting the same images to the same file again continues where it stopped."
+            messagebox.showerror("❌ Error", f"An error occurred during conversion:\n\n{finished[1]}{resume_note}")
             self.status_label.config(text="❌ Error occurred during conversion")
-        finally:
-            self.progress['value'] = 0
+            
+    def cancel_conversion(self):
+        """Ask the running conversion to stop"""
+        if self.is_converting():
+            self.cancel_event.set()
+            self.cancel_btn.config(state=tk.DISABLED, bg=self.colors['border'])
+            self.status_label.config(text="⛔ Cancelling conversion...")
+            
+    def is_converting(self):
+        """Check whether a conversion is running in the background"""
+        return self.conversion_thread is not None
+        
+    def set_controls_state(self, state):
+        """Enable or disable everything that could change the job while it runs"""
+        for btn in (self.select_btn, self.folder_btn, self.clear_btn, self.move_up_btn,
+                    self.move_down_btn, self.remove_btn, self.sort_btn):
+            btn.config(state=state)
+            
+        if state == tk.DISABLED:
+            self.page_size_box.config(state=tk.DISABLED)
+            self.compression_box.config(state=tk.DISABLED)
+            self.append_check.config(state=tk.DISABLED)
+            self.split_box.config(state=tk.DISABLED)
+            self.frames_box.config(state=tk.DISABLED)
+            self.cache_check.config(state=tk.DISABLED)
+            self.dpi_box.config(state=tk.DISABLED)
+            self.convert_btn.config(state=tk.DISABLED, bg=self.colors['border'])
+            self.cancel_btn.config(state=tk.NORMAL, bg=self.colors['warning'])
+        else:
+            self.page_size_box.config(state='readonly')
+            self.compression_box.config(state='readonly')
+            self.append_check.config(state=tk.NORMAL)
+            self.split_box.config(state='readonly')
+            self.frames_box.config(state='readonly')
+            self.cache_check.config(state=tk.NORMAL)
+            self.on_page_size_change()
+            self.cancel_btn.config(state=tk.DISABLED, bg=self.colors['border'])
+            if self.image_files:
+                self.convert_btn.config(state=tk.NORMAL, bg=self.colors['accent'])
+                
+    def on_close(self):
+        """Cancel a running conversion before closing the window"""
+        if self.is_converting():
+            self.close_requested = True
+            self.cancel_conversion()
+        else:
+            self.root.destroy()
             
     def move_up(self):
         """Move selected image up in the list"""
@@ -718,10 +1268,10 @@ class ImageToPDFConverter:
         index = selection[0]
         if index > 0:
             # Swap items in the list
-            self.image_files[index], self.image_files[index-1] = self.image_files[index-1], self.image_files[index]
+            self.image_files.swap(index, index-1)
             
-            # Update the display
-            self.update_file_list()
+            # Update the display (only the two swapped rows change)
+            self.listbox.refresh_rows(index-1, index)
             
             # Maintain selection on the moved item
             self.listbox.selection_set(index-1)
@@ -739,10 +1289,10 @@ class ImageToPDFConverter:
         index = selection[0]
         if index < len(self.image_files) - 1:
             # Swap items in the list
-            self.image_files[index], self.image_files[index+1] = self.image_files[index+1], self.image_files[index]
+            self.image_files.swap(index, index+1)
             
-            # Update the display
-            self.update_file_list()
+            # Update the display (only the two swapped rows change)
+            self.listbox.refresh_rows(index, index+1)
             
             # Maintain selection on the moved item
             self.listbox.selection_set(index+1)
@@ -761,6 +1311,9 @@ class ImageToPDFConverter:
         if index < len(self.image_files):
             # Remove from list
             removed_file = self.image_files.pop(index)
+            self.file_details.pop(removed_file, None)
+            self.file_problems.pop(removed_file, None)
+            self.sort_index.discard(removed_file)
             
             # Update display
             self.update_file_list()
@@ -777,22 +1330,59 @@ class ImageToPDFConverter:
             
             self.status_label.config(text=f"🗑️ Removed {os.path.basename(removed_file)}")
             
-    def sort_alphabetically(self):
-        """Sort images alphabetically by filename"""
-        if len(self.image_files) < 2:
+    def show_sort_menu(self):
+        """Drop the sort menu down under the sort button"""
+        if len(self.image_files) < 2 or self.sort_thread is not None:
             return
-            
-        # Sort by filename
-        self.image_files.sort(key=lambda x: os.path.basename(x).lower())
+        self.sort_menu.tk_popup(self.sort_btn.winfo_rootx(),
+                                self.sort_btn.winfo_rooty() + self.sort_btn.winfo_height())
+        
+    def sort_images(self, order):
+        """Sort by order, reading file details in the background the first time they're needed"""
+        if self.sort_index.missing(self.image_files, order):
+            # Parallel header/EXIF reads; the list is sorted once they are done
+            self.sort_btn.config(state=tk.DISABLED)
+            self.status_label.config(text="🔄 Reading image details for sorting...")
+            self.sort_thread = threading.Thread(
+                target=self.sort_index.fill,
+                args=(list(self.image_files),),
+                daemon=True
+            )
+            self.sort_thread.start()
+            self.root.after(PROGRESS_POLL_MS, self.poll_sort, order)
+            return
+        self.apply_sort(order)
         
+    def poll_sort(self, order):
+        """Wait for the sort index to fill, then sort"""
+        if self.sort_thread.is_alive():
+            self.root.after(PROGRESS_POLL_MS, self.poll_sort, order)
+            return
+        self.sort_thread = None
+        if not self.is_converting():
+            self.sort_btn.config(state=tk.NORMAL)
+            self.apply_sort(order)
+            
+    def apply_sort(self, order):
+        """Reorder the list in memory from the sort index"""
+        self.image_files.sort(key=self.sort_index.key(order))
+        self.after_reorder()
+        label = next(label for label, value in SORT_CHOICES.items() if value == order)
+        self.status_label.config(text=f"✅ Images sorted by {label.split(' ', 1)[1].lower()}")
+        
+    def reverse_order(self):
+        """Reverse the current page order"""
+        self.image_files.reverse()
+        self.after_reorder()
+        self.status_label.config(text="🔃 Page order reversed")
+        
+    def after_reorder(self):
         # Update display
         self.update_file_list()
         
         # Clear selection and thumbnail
         self.listbox.selection_clear(0, tk.END)
         self.clear_thumbnail()
-        
-        self.status_label.config(text="🔤 Images sorted alphabetically")
 
 def main():
     root = tk.Tk()
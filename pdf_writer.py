@@ -0,0 +1,1065 @@
+"""
+Streaming PDF writer for Image to PDF Converter
+Each page is encoded and written to disk as soon as it is ready, so memory use
+stays flat no matter how many images are in the batch.
+"""
+
+import copy
+import hashlib
+import mmap
+import os
+import struct
+import time
+from collections import deque
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageChops, PdfParser, features
+
+from instrumentation import PageStats, peak_rss_bytes
+
+# A new PDF is written under this suffix and renamed into place once complete
+PARTIAL_SUFFIX = ".part"
+
+# Formats that may hold several images; each frame becomes its own page
+MULTI_FRAME_EXTENSIONS = ('.tif', '.tiff', '.gif', '.webp')
+
+# Multi-frame formats whose frames can only be reached by decoding the ones
+# before them; their frames are encoded in one pass per file
+SEQUENTIAL_FRAME_EXTENSIONS = ('.gif', '.webp')
+
+# Pixels per inch used to size pages (72 points per inch)
+DEFAULT_RESOLUTION = 100.0
+
+# Output resolution for fixed page sizes
+DEFAULT_DPI = 150
+
+# Fixed page sizes in points, portrait orientation
+PAGE_SIZES = {
+    'a4': (595.28, 841.89),
+    'letter': (612.0, 792.0),
+}
+
+
+class PageLayout:
+    """Where an image goes on its page and how many pixels it needs there
+
+    With no page_size every page takes the image's own size at
+    DEFAULT_RESOLUTION, as before. With a named page size the image is fitted
+    (and centred) on the page in the matching orientation and downsampled to
+    the pixels needed at dpi; images are never upscaled.
+    """
+
+    def __init__(self, page_size=None, dpi=DEFAULT_DPI):
+        if page_size is not None and page_size not in PAGE_SIZES:
+            raise ValueError(f"unknown page size: {page_size}")
+        self.page_size = page_size
+        self.dpi = dpi
+
+    def place(self, width, height):
+        """Return (page_width, page_height, (x, y, w, h) in points, (pixel_w, pixel_h))"""
+        if self.page_size is None:
+            page_width = width * 72.0 / DEFAULT_RESOLUTION
+            page_height = height * 72.0 / DEFAULT_RESOLUTION
+            return page_width, page_height, (0, 0, page_width, page_height), (width, height)
+
+        page_width, page_height = PAGE_SIZES[self.page_size]
+        if (width > height) != (page_width > page_height):
+            page_width, page_height = page_height, page_width
+
+        scale = min(page_width / width, page_height / height)
+        draw_width, draw_height = width * scale, height * scale
+        x = (page_width - draw_width) / 2
+        y = (page_height - draw_height) / 2
+
+        pixels = (min(width, max(1, round(draw_width / 72.0 * self.dpi))),
+                  min(height, max(1, round(draw_height / 72.0 * self.dpi))))
+        return page_width, page_height, (x, y, draw_width, draw_height), pixels
+
+
+# Layout used when none is given: page size follows the image
+NATIVE_LAYOUT = PageLayout()
+
+# Source files are hashed and copied through memory maps this many bytes at a
+# time (a multiple of the page size), releasing each window before the next
+MAP_WINDOW_BYTES = 8 * 1024 * 1024
+
+# Dropping windows already read from the mapping keeps them out of peak RSS
+# (the data stays in the OS page cache); not every platform can do it
+CAN_DROP_PAGES = hasattr(mmap.mmap, "madvise") and hasattr(mmap, "MADV_DONTNEED")
+
+
+def file_windows(f):
+    """Yield the contents of an open file as consecutive memoryviews
+
+    The file is memory-mapped, so hashing or copying it never builds bytes
+    objects; each window is released (and dropped from this process's
+    resident memory where possible) once the consumer asks for the next
+    one. Files that can't be mapped (empty, or on a file system without
+    mmap) are read in chunks instead.
+    """
+    try:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        for chunk in iter(lambda: f.read(MAP_WINDOW_BYTES), b""):
+            yield memoryview(chunk)
+        return
+    with mapped, memoryview(mapped) as view:
+        if CAN_DROP_PAGES and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        for start in range(0, len(view), MAP_WINDOW_BYTES):
+            window = view[start:start + MAP_WINDOW_BYTES]
+            length = len(window)
+            try:
+                yield window
+            finally:
+                # The map can only be closed once no view of it is left
+                window.release()
+            if CAN_DROP_PAGES:
+                mapped.madvise(mmap.MADV_DONTNEED, start, length)
+
+
+class MappedFile:
+    """Page data that is a source file unchanged, copied into the PDF when written
+
+    Used for passthrough JPEGs instead of the file's bytes: it pickles as
+    the path and size only, so encoder processes don't send the image back
+    through the pool, and write_to() copies it to the output straight from a
+    memory map.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def write_to(self, f):
+        """Copy the file into f, checking it is still the size the page was built for"""
+        written = 0
+        with open(self.path, "rb") as source:
+            if os.fstat(source.fileno()).st_size == self.size:
+                for window in file_windows(source):
+                    f.write(window)
+                    written += len(window)
+        if written != self.size:
+            raise OSError(f"{self.path} changed while it was being converted")
+
+
+# Bump when encoders change, so cached page streams from older versions are not reused
+ENCODER_VERSION = 1
+
+
+class ImagePage:
+    """An encoded image ready to be embedded as a single PDF page"""
+
+    def __init__(self, width, height, data, color_space="DeviceRGB",
+                 bits_per_component=8, filter_name="DCTDecode",
+                 page_size=None, image_box=None, decode_parms=None, palette=None,
+                 passthrough=False):
+        self.width = width
+        self.height = height
+        self.data = data
+        self.color_space = color_space
+        self.bits_per_component = bits_per_component
+        self.filter_name = filter_name
+        self.decode_parms = decode_parms
+        # RGB palette bytes for indexed images (color_space is then the base space)
+        self.palette = palette
+        if page_size is None:
+            page_size = (width * 72.0 / DEFAULT_RESOLUTION, height * 72.0 / DEFAULT_RESOLUTION)
+        # Page size in points, and the rectangle the image fills on it
+        self.page_size = page_size
+        self.image_box = image_box or (0, 0) + tuple(page_size)
+        # True when data is the source file itself (a MappedFile) rather than a fresh encode
+        self.passthrough = passthrough
+        # Content hash of the source file; pages with the same digest share one image
+        self.digest = None
+        # instrumentation.PageStats filled in while the page is produced and written
+        self.stats = None
+
+    def fields(self):
+        """Constructor arguments that recreate this page (stored by the page cache)"""
+        return {
+            'width': self.width,
+            'height': self.height,
+            'data': self.data,
+            'color_space': self.color_space,
+            'bits_per_component': self.bits_per_component,
+            'filter_name': self.filter_name,
+            'page_size': self.page_size,
+            'image_box': self.image_box,
+            'decode_parms': self.decode_parms,
+            'palette': self.palette,
+        }
+
+    def shared(self):
+        """A copy without the data, for pages that reuse an image already written"""
+        page = copy.copy(self)
+        page.data = None
+        return page
+
+
+# JPEG color modes that can be embedded as-is with DCTDecode
+PASSTHROUGH_COLOR_SPACES = {
+    'RGB': "DeviceRGB",
+    'L': "DeviceGray",
+}
+
+
+class PageError:
+    """Stands in for a page whose image could not be encoded
+
+    encode_images yields one in place of the page when asked to skip bad
+    images, so the consumer can report it and carry on with the next page.
+    """
+
+    def __init__(self, image_file, error, stats=None):
+        self.image_file = image_file
+        self.error = error
+        self.stats = stats
+
+    @property
+    def message(self):
+        return str(self.error) or type(self.error).__name__
+
+
+def is_passthrough_jpeg(img):
+    """Check whether an opened image is a baseline JPEG the PDF can embed unchanged"""
+    return (img.format == "JPEG"
+            and img.mode in PASSTHROUGH_COLOR_SPACES
+            and "progressive" not in img.info
+            and "progression" not in img.info)
+
+
+# JPEG quality used unless a profile sets one (Pillow's default)
+DEFAULT_JPEG_QUALITY = 75
+
+# Longest side of the nearest-neighbour sample used to classify a page
+CLASSIFY_SAMPLE_SIZE = 512
+
+# Most distinct colors a page may use to be stored losslessly as line art
+LINE_ART_COLORS = 64
+
+# Largest per-channel difference for an RGB page to count as grayscale
+GRAY_TOLERANCE = 6
+
+# Gray levels counted as black or white when looking for bilevel pages
+BILEVEL_DARK = 64
+BILEVEL_LIGHT = 192
+
+# Gray to 1-bit threshold table
+BILEVEL_TABLE = [0] * 128 + [255] * 128
+
+# TIFF tags read back when extracting a CCITT G4 strip
+TIFF_PHOTOMETRIC = 262
+TIFF_STRIP_OFFSETS = 273
+TIFF_ROWS_PER_STRIP = 278
+TIFF_STRIP_BYTE_COUNTS = 279
+
+# Pillow writes Group 4 TIFFs through libtiff; without it bilevel pages use Flate
+HAVE_LIBTIFF = features.check("libtiff")
+
+
+class CompressionProfile:
+    """How pages are classified and which encoder each kind of page gets
+
+    With classify off every page is an RGB JPEG, as in earlier versions.
+    Otherwise each page is classified as photo, gray, bilevel, palette or
+    line art and stored as RGB JPEG, grayscale JPEG, CCITT Group 4 or Flate.
+    A grayscale page is thresholded to 1 bit when at least bilevel_ratio of
+    its pixels are near black or white. Baseline JPEGs that need no resizing
+    are embedded unchanged when passthrough is on.
+    """
+
+    def __init__(self, jpeg_quality=DEFAULT_JPEG_QUALITY, classify=True,
+                 bilevel_ratio=0.97, passthrough=True):
+        self.jpeg_quality = jpeg_quality
+        self.classify = classify
+        self.bilevel_ratio = bilevel_ratio
+        self.passthrough = passthrough
+
+    def with_quality(self, jpeg_quality):
+        """Copy of this profile with a different JPEG quality"""
+        return CompressionProfile(jpeg_quality, self.classify, self.bilevel_ratio, self.passthrough)
+
+
+# Named per-job compression profiles
+COMPRESSION_PROFILES = {
+    'auto': CompressionProfile(),
+    'photo': CompressionProfile(classify=False),
+    'compact': CompressionProfile(jpeg_quality=60, bilevel_ratio=0.9, passthrough=False),
+}
+
+DEFAULT_PROFILE = COMPRESSION_PROFILES['auto']
+
+
+def classify_image(img, profile=DEFAULT_PROFILE):
+    """Return (kind, image converted for that kind's encoder)
+
+    kind is one of 'photo', 'gray', 'bilevel', 'palette' or 'line art'.
+    Colors are judged on a small nearest-neighbour sample, so the cost does
+    not grow with the page size.
+    """
+    if img.mode == '1':
+        return 'bilevel', img
+    if img.mode == 'P' and 'transparency' not in img.info:
+        return 'palette', img
+    if img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+
+    scale = CLASSIFY_SAMPLE_SIZE / max(img.size)
+    if scale < 1:
+        sample = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                            Image.Resampling.NEAREST)
+    else:
+        sample = img
+
+    if img.mode == 'RGB':
+        gray_sample = sample.convert('L')
+        difference = ImageChops.difference(sample, gray_sample.convert('RGB'))
+        if max(high for low, high in difference.getextrema()) <= GRAY_TOLERANCE:
+            img, sample = img.convert('L'), gray_sample
+
+    if img.mode == 'L':
+        histogram = sample.histogram()
+        extremes = sum(histogram[:BILEVEL_DARK]) + sum(histogram[BILEVEL_LIGHT:])
+        if extremes >= profile.bilevel_ratio * sample.width * sample.height:
+            return 'bilevel', img.point(BILEVEL_TABLE, '1')
+
+    if sample.getcolors(LINE_ART_COLORS) is not None:
+        return 'line art', img
+    return ('gray' if img.mode == 'L' else 'photo'), img
+
+
+def encode_jpeg(img, quality=DEFAULT_JPEG_QUALITY):
+    """Encode an L or RGB image as a DCTDecode page"""
+    buffer = BytesIO()
+    img.save(buffer, "JPEG", quality=quality)
+    return ImagePage(img.width, img.height, buffer.getvalue(),
+                     color_space=PASSTHROUGH_COLOR_SPACES[img.mode])
+
+
+def encode_flate(img):
+    """Encode a 1, L, P or RGB image losslessly as a FlateDecode page
+
+    The PNG encoder already produces a zlib stream of predictor-filtered rows,
+    which is exactly what FlateDecode with /Predictor 15 expects, so its IDAT
+    data is embedded as-is.
+    """
+    buffer = BytesIO()
+    img.save(buffer, "PNG")
+    png = buffer.getvalue()
+
+    idat = []
+    palette = None
+    position = 8
+    while position < len(png):
+        length, chunk_type = struct.unpack(">I4s", png[position:position + 8])
+        chunk = png[position + 8:position + 8 + length]
+        if chunk_type == b"IHDR":
+            bits, color_type = chunk[8], chunk[9]
+        elif chunk_type == b"PLTE":
+            palette = chunk
+        elif chunk_type == b"IDAT":
+            idat.append(chunk)
+        position += 12 + length
+
+    colors = 3 if color_type == 2 else 1
+    return ImagePage(img.width, img.height, b"".join(idat),
+                     color_space="DeviceGray" if color_type == 0 else "DeviceRGB",
+                     bits_per_component=bits,
+                     filter_name="FlateDecode",
+                     decode_parms={
+                         'Predictor': 15,
+                         'Colors': colors,
+                         'BitsPerComponent': bits,
+                         'Columns': img.width,
+                     },
+                     palette=palette)
+
+
+def encode_ccitt(img):
+    """Encode a 1-bit image as a CCITT Group 4 page"""
+    buffer = BytesIO()
+    # A single strip holds the whole page as one G4 stream
+    img.save(buffer, "TIFF", compression="group4", tiffinfo={TIFF_ROWS_PER_STRIP: img.height})
+    buffer.seek(0)
+    with Image.open(buffer) as tiff:
+        offset = tiff.tag_v2[TIFF_STRIP_OFFSETS][0]
+        length = tiff.tag_v2[TIFF_STRIP_BYTE_COUNTS][0]
+        # The codec treats 0 bits as white; with BlackIsZero those are the black pixels
+        black_is_zero = tiff.tag_v2.get(TIFF_PHOTOMETRIC) == 1
+    return ImagePage(img.width, img.height, buffer.getvalue()[offset:offset + length],
+                     color_space="DeviceGray",
+                     bits_per_component=1,
+                     filter_name="CCITTFaxDecode",
+                     decode_parms={
+                         'K': -1,
+                         'Columns': img.width,
+                         'Rows': img.height,
+                         'BlackIs1': black_is_zero,
+                     })
+
+
+def prepare_image(img, profile=DEFAULT_PROFILE):
+    """Pick the kind of encoder for a decoded image; return (kind, image converted to suit)"""
+    if not profile.classify:
+        return 'photo', img if img.mode == 'RGB' else img.convert('RGB')
+    return classify_image(img, profile)
+
+
+def encode_prepared(kind, img, profile=DEFAULT_PROFILE):
+    """Encode an image returned by prepare_image with the encoder for its kind"""
+    if kind == 'bilevel':
+        return encode_ccitt(img) if HAVE_LIBTIFF else encode_flate(img)
+    if kind in ('palette', 'line art'):
+        return encode_flate(img)
+    return encode_jpeg(img, profile.jpeg_quality)
+
+
+def downsample(img, size):
+    """Shrink a decoded image to size"""
+    # Pillow only resizes 1-bit and palette images with NEAREST
+    if img.mode in ('1', 'P'):
+        img = img.convert('L' if img.mode == '1' else 'RGB')
+    # reducing_gap runs a fast box reduce() before the final LANCZOS pass
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def frame_count(path):
+    """Number of frames in an image file (1 for single-image formats or unreadable files)"""
+    if not path.lower().endswith(MULTI_FRAME_EXTENSIONS):
+        return 1
+    try:
+        # Reads frame headers only (TIFF IFDs, GIF blocks, WebP chunks); seeking to
+        # a GIF or WebP frame later decodes every frame before it, see encode_frames
+        with Image.open(path) as img:
+            return getattr(img, 'n_frames', 1)
+    except Exception:
+        # Left for encode_image to report at the right page
+        return 1
+
+
+def split_source(source):
+    """A page source is an image path or a (path, frame) pair; return (path, frame or None)"""
+    if isinstance(source, str):
+        return source, None
+    return source[0], source[1]
+
+
+def encode_image(source, layout=NATIVE_LAYOUT, profile=DEFAULT_PROFILE):
+    """Encode an image file (or one frame of it) as a page
+
+    source is a path or a (path, frame) pair, see split_source. Only the
+    requested frame is encoded, but GIF and WebP decode every earlier frame
+    to reach it; use encode_frames for runs of frames from those files.
+    Baseline JPEGs are embedded without re-encoding. The page's stats
+    record the time spent in each stage.
+    """
+    image_path, frame = split_source(source)
+    stats = PageStats(image_path, frame)
+    with stats.stage('open'):
+        # Only the header is parsed here
+        img = Image.open(image_path)
+        if frame is None:
+            stats.bytes_read = os.path.getsize(image_path)
+
+    with img:
+        if frame is not None:
+            with stats.stage('seek'):
+                img.seek(frame)
+        return _encode_opened(img, image_path, frame, stats, layout, profile)
+
+
+def encode_frames(image_path, frames, layout=NATIVE_LAYOUT, profile=DEFAULT_PROFILE):
+    """Encode frames (ascending indices) of one file, yielding a page or the error for each
+
+    The file is opened once and each seek carries on from the previous
+    frame, so a GIF or WebP costs one pass over its frames rather than a
+    pass per page. A frame that fails gives its exception in place of the
+    page; the frames after it are still tried.
+    """
+    try:
+        img = Image.open(image_path)
+    except Exception as e:
+        for frame in frames:
+            yield e
+        return
+    with img:
+        for frame in frames:
+            stats = PageStats(image_path, frame)
+            try:
+                with stats.stage('seek'):
+                    img.seek(frame)
+                page = _encode_opened(img, image_path, frame, stats, layout, profile)
+            except Exception as e:
+                page = e
+            yield page
+
+
+def encode_frame_list(image_path, frames, layout=NATIVE_LAYOUT, profile=DEFAULT_PROFILE):
+    """encode_frames as a list, for running on a process pool"""
+    return list(encode_frames(image_path, frames, layout, profile))
+
+
+def _encode_opened(img, image_path, frame, stats, layout, profile):
+    """Encode the current frame of an opened image as a page"""
+    page_width, page_height, image_box, pixels = layout.place(img.width, img.height)
+
+    if (profile.passthrough and frame is None and pixels == img.size
+            and is_passthrough_jpeg(img)):
+        # The writer copies the file into the PDF itself; nothing is read here
+        page = ImagePage(img.width, img.height, MappedFile(image_path, stats.bytes_read),
+                         color_space=PASSTHROUGH_COLOR_SPACES[img.mode],
+                         passthrough=True)
+        stats.source = 'passthrough'
+    else:
+        with stats.stage('decode'):
+            if pixels != img.size:
+                # JPEG DCT scaling decodes at 1/2, 1/4 or 1/8 size without touching full resolution
+                img.draft(img.mode if img.mode in ('RGB', 'L') else None, pixels)
+            img.load()
+        if pixels != img.size:
+            with stats.stage('resize'):
+                img = downsample(img, pixels)
+        with stats.stage('classify'):
+            kind, img = prepare_image(img, profile)
+        with stats.stage('encode'):
+            page = encode_prepared(kind, img, profile)
+        stats.kind = kind
+
+    page.page_size = (page_width, page_height)
+    page.image_box = image_box
+    stats.filter_name = page.filter_name
+    stats.peak_rss_bytes = peak_rss_bytes()
+    page.stats = stats
+    return page
+
+
+def file_digest(path):
+    """Content hash of a file, or None if it cannot be read"""
+    digest = hashlib.blake2b(digest_size=20)
+    try:
+        with open(path, "rb") as f:
+            for window in file_windows(f):
+                digest.update(window)
+    except OSError:
+        # Left for encode_image to report at the right page
+        return None
+    return digest.hexdigest()
+
+
+def encoding_settings(layout=NATIVE_LAYOUT, profile=DEFAULT_PROFILE):
+    """Describe everything besides the source bytes that decides an encoded page"""
+    return (f"v{ENCODER_VERSION}:{layout.page_size}:{layout.dpi}:{profile.jpeg_quality}:"
+            f"{int(profile.classify)}:{profile.bilevel_ratio}:{int(profile.passthrough)}")
+
+
+def frame_run(sources, start):
+    """Number of sources from start on that encode_frames can take in one pass
+
+    A run is consecutive frames of one GIF or WebP file in ascending order;
+    anything else (and any TIFF frame, which seeks without decoding) is a
+    run of one.
+    """
+    image_path, frame = split_source(sources[start])
+    if frame is None or not image_path.lower().endswith(SEQUENTIAL_FRAME_EXTENSIONS):
+        return 1
+    end = start + 1
+    while end < len(sources):
+        next_path, next_frame = split_source(sources[end])
+        if next_path != image_path or next_frame is None or next_frame <= frame:
+            break
+        frame = next_frame
+        end += 1
+    return end - start
+
+
+def _run_results(future, count):
+    """Pages of an encode_frame_list pool job, one at a time
+
+    If the job itself fails, each of its count pages gives the error.
+    """
+    try:
+        pages = future.result()
+    except Exception as e:
+        pages = [e] * count
+    yield from pages
+
+
+def encode_images(image_paths, workers=None, layout=NATIVE_LAYOUT, profile=DEFAULT_PROFILE,
+                  max_in_flight=None, page_cache=None, skip_errors=False, executor=None):
+    """Encode images on a process pool, yielding pages in input order
+
+    image_paths holds page sources (paths or (path, frame) pairs). A TIFF
+    frame is a separate job that seeks to its frame, so a multi-page file
+    is never decoded as a whole. Frames of a GIF or WebP can only be reached
+    through the ones before them, so each run of them (see frame_run) is a
+    single job that walks the file once: files are encoded in parallel, the
+    frames of one of these files are not.
+
+    At most max_in_flight pages (twice the worker count by default) are
+    submitted ahead of the page being written, which bounds memory use; a
+    run of frames is submitted as a whole, and its pages are held until
+    they are written. executor, a ProcessPoolExecutor shared with other
+    jobs, runs the encodes instead of a pool of their own and is left
+    running afterwards.
+
+    Files are hashed as they are queued: an image whose bytes were already
+    seen in this job is not encoded again, its page is a data-less copy with
+    the same digest (PDFWriter then points it at the image already written).
+    page_cache, a disk_cache.PageCache, supplies and stores encodes across jobs.
+
+    With skip_errors=True an image that fails to encode (corrupt file, too
+    large for memory, ...) yields a PageError instead of ending the job; a
+    broken process pool still raises.
+    """
+    image_paths = list(image_paths)
+    workers = workers or os.cpu_count() or 1
+    settings = encoding_settings(layout, profile)
+
+    own_executor = None
+    if executor is None and workers > 1 and len(image_paths) > 1:
+        executor = own_executor = ProcessPoolExecutor(max_workers=min(workers, len(image_paths)))
+    if executor is not None:
+        max_in_flight = max_in_flight or workers * 2
+    else:
+        # Encode on this thread, one page at a time
+        max_in_flight = 1
+
+    next_source = 0
+    # (kind, digest, payload, stats): 'shared' pages reuse an earlier image,
+    # 'cached' carries a page from page_cache, 'future' a pool job, 'path' a
+    # file to encode here and 'frames' a (future or None, results) pair whose
+    # results iterator gives the pages of a run of frames in turn; stats
+    # collects the time spent on this side
+    pending = deque()
+    seen = set()
+    first_pages = {}
+    # Digests whose first page failed, so their repeats fail the same way
+    failed = {}
+    # Frames of a file come one after another: hash the file once for all of them
+    last_hashed = (None, None)
+
+    def look_up(source):
+        """Return (digest, stats, entry) for a source; entry is None if it needs encoding"""
+        nonlocal last_hashed
+        image_path, frame = split_source(source)
+        stats = PageStats(image_path, frame)
+        if last_hashed[0] != image_path:
+            with stats.stage('hash'):
+                last_hashed = (image_path, file_digest(image_path))
+        digest = last_hashed[1]
+        if digest is not None and frame is not None:
+            digest = f"{digest}#{frame}"
+        if digest is not None and digest in seen:
+            return digest, stats, ('shared', digest, None, stats)
+        seen.add(digest)
+        if page_cache is not None and digest is not None:
+            with stats.stage('cache'):
+                fields = page_cache.get(digest, settings)
+            if fields is not None:
+                return digest, stats, ('cached', digest, ImagePage(**fields), stats)
+        return digest, stats, None
+
+    def queue_next():
+        nonlocal next_source
+        if next_source == len(image_paths):
+            return False
+        run = image_paths[next_source:next_source + frame_run(image_paths, next_source)]
+        next_source += len(run)
+
+        if len(run) == 1:
+            digest, stats, entry = look_up(run[0])
+            if entry is None and executor is not None:
+                future = executor.submit(encode_image, run[0], layout, profile)
+                entry = ('future', digest, future, stats)
+            elif entry is None:
+                entry = ('path', digest, run[0], stats)
+            pending.append(entry)
+            return True
+
+        entries = [look_up(source) for source in run]
+        frames = [split_source(source)[1] for source, (digest, stats, entry)
+                  in zip(run, entries) if entry is None]
+        job = None
+        if frames and executor is not None:
+            future = executor.submit(encode_frame_list, run[0][0], frames, layout, profile)
+            job = (future, _run_results(future, len(frames)))
+        elif frames:
+            job = (None, encode_frames(run[0][0], frames, layout, profile))
+        for digest, stats, entry in entries:
+            pending.append(entry or ('frames', digest, job, stats))
+        return True
+
+    try:
+        while len(pending) < max_in_flight and queue_next():
+            pass
+
+        while pending:
+            kind, digest, payload, stats = pending.popleft()
+            if kind == 'shared' and digest in failed:
+                queue_next()
+                yield PageError(stats.image_file, failed[digest], stats)
+                continue
+            if kind == 'shared':
+                page = first_pages[digest].shared()
+                stats.source = 'shared'
+            else:
+                if kind == 'cached':
+                    page = payload
+                    stats.source = 'cache'
+                else:
+                    try:
+                        if kind == 'future':
+                            page = payload.result()
+                        elif kind == 'frames':
+                            page = next(payload[1])
+                            if isinstance(page, Exception):
+                                raise page
+                        else:
+                            page = encode_image(payload, layout, profile)
+                    except Exception as e:
+                        if not skip_errors or isinstance(e, BrokenExecutor):
+                            raise
+                        failed[digest] = e
+                        queue_next()
+                        yield PageError(stats.image_file, e, stats)
+                        continue
+                    stats.merge(page.stats)
+                    if page_cache is not None and digest is not None and not page.passthrough:
+                        with stats.stage('cache'):
+                            page_cache.put(digest, settings, page.fields())
+                if digest is not None:
+                    page.digest = digest
+                    first_pages[digest] = page.shared()
+            stats.filter_name = page.filter_name
+            page.stats = stats
+            queue_next()
+            yield page
+    finally:
+        # Drop queued work if the consumer stops early (error or cancel)
+        for kind, digest, payload, stats in pending:
+            if kind == 'future':
+                payload.cancel()
+            elif kind == 'frames':
+                if payload[0] is not None:
+                    payload[0].cancel()
+                payload[1].close()
+        if own_executor is not None:
+            own_executor.shutdown(wait=True)
+
+
+class ExistingDocument:
+    """What an incremental update needs to know about a PDF already on disk"""
+
+    def __init__(self, path):
+        try:
+            with PdfParser.PdfParser(filename=path) as parser:
+                self.size = parser.trailer_dict[b"Size"]
+                self.prev = parser.last_xref_section_offset
+                self.root_ref = parser.root_ref
+                self.info_ref = parser.info_ref
+                self.info = dict(parser.info)
+                self.pages_ref = parser.pages_ref
+                self.page_tree_root = dict(parser.page_tree_root)
+        except PdfParser.PdfFormatError as e:
+            raise ValueError(f"cannot append to {path}: {e}") from e
+
+
+class PDFWriter:
+    """Write image pages to a PDF file one page at a time
+
+    Only the byte offset of each object is kept in memory; page data is
+    written out immediately and released by the caller.
+
+    A new document is written to output_file + PARTIAL_SUFFIX and renamed
+    over output_file by close(), so the output path never holds a half
+    written PDF. checkpoint() returns what was written since the previous
+    checkpoint; a writer created with those checkpoints carries on from the
+    last of them in the partial file left by suspend() (or a crash).
+
+    With append=True and an existing output file, the new pages are written
+    after the existing bytes as an incremental update (new objects, an xref
+    section for them and a trailer pointing back at the previous one). Old
+    objects are never rewritten except the page tree root and the Info
+    dictionary, so the cost follows the number of pages added. Appends are
+    written in place and can't be resumed; abort() restores the old file.
+    """
+
+    def __init__(self, output_file, append=False, checkpoints=None):
+        self.output_file = output_file
+        self.page_count = 0
+        self._offsets = {}
+        self._page_refs = []
+        self._base = None
+        # Image XObjects already written, by source digest
+        self._images = {}
+        # Written since the last checkpoint
+        self._new_objects = []
+        self._new_images = {}
+        self._checkpointed_pages = 0
+
+        if append and os.path.exists(output_file):
+            self._base = ExistingDocument(output_file)
+            self._path = output_file
+            self._file = open(output_file, "r+b")
+            self._append_offset = self._file.seek(0, os.SEEK_END)
+            self._next_object_id = self._base.size
+            self._file.write(b"\n")
+        elif checkpoints:
+            self._path = output_file + PARTIAL_SUFFIX
+            self._restore(checkpoints)
+            return
+        else:
+            self._path = output_file + PARTIAL_SUFFIX
+            self._file = open(self._path, "wb")
+            self._next_object_id = 1
+            self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+        # The page tree node for the new pages is written last, once they are all known
+        self._pages_ref = self._allocate()
+
+    def _restore(self, checkpoints):
+        """Reopen the partial file and rebuild the state recorded in checkpoints"""
+        for checkpoint in checkpoints:
+            for object_id, offset in checkpoint["objects"]:
+                self._offsets[object_id] = (offset, 0)
+            self._page_refs += [PdfParser.IndirectReference(object_id, 0)
+                                for object_id in checkpoint["pages"]]
+            for digest, object_id in checkpoint["images"].items():
+                self._images[digest] = PdfParser.IndirectReference(object_id, 0)
+        last = checkpoints[-1]
+        self.page_count = self._checkpointed_pages = len(self._page_refs)
+        self._next_object_id = last["next_object_id"]
+        self._pages_ref = PdfParser.IndirectReference(last["pages_ref"], 0)
+
+        self._file = open(self._path, "r+b")
+        if self._file.seek(0, os.SEEK_END) < last["size"]:
+            self._file.close()
+            raise ValueError(f"{self._path} is shorter than its last checkpoint")
+        # Anything after the checkpoint belongs to a page that was never finished
+        self._file.truncate(last["size"])
+        self._file.seek(last["size"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def size(self):
+        """Bytes written to the file so far"""
+        return self._file.tell()
+
+    def has_image(self, digest):
+        """Check whether the image with this source digest is already in the file"""
+        return digest in self._images
+
+    def checkpoint(self):
+        """Flush the file and return what was written since the last checkpoint
+
+        The result is JSON-serializable; pass every checkpoint taken so far,
+        in order, to a new writer to resume from this point.
+        """
+        self._file.flush()
+        checkpoint = {
+            "size": self._file.tell(),
+            "next_object_id": self._next_object_id,
+            "pages_ref": self._pages_ref.object_id,
+            "objects": [[object_id, self._offsets[object_id][0]] for object_id in self._new_objects],
+            "pages": [ref.object_id for ref in self._page_refs[self._checkpointed_pages:]],
+            "images": {digest: ref.object_id for digest, ref in self._new_images.items()},
+        }
+        self._new_objects = []
+        self._new_images = {}
+        self._checkpointed_pages = len(self._page_refs)
+        return checkpoint
+
+    def _allocate(self):
+        ref = PdfParser.IndirectReference(self._next_object_id, 0)
+        self._next_object_id += 1
+        return ref
+
+    def _write_object(self, ref, obj, stream=None):
+        if ref is None:
+            ref = self._allocate()
+        self._offsets[ref.object_id] = (self._file.tell(), ref.generation)
+        self._new_objects.append(ref.object_id)
+        if stream is not None:
+            obj["Length"] = len(stream)
+        self._file.write(bytes(PdfParser.IndirectObjectDef(*ref)))
+        self._file.write(PdfParser.pdf_repr(obj))
+        if stream is not None:
+            self._file.write(b"\nstream\n")
+            if isinstance(stream, MappedFile):
+                stream.write_to(self._file)
+            else:
+                self._file.write(stream)
+            self._file.write(b"\nendstream")
+        self._file.write(b"\nendobj\n")
+        return ref
+
+    def add_page(self, page):
+        """Write an encoded page (image, content stream and page object)
+
+        A page whose digest matches an image already written in this file
+        reuses that image XObject, so its data may be None.
+        """
+        width, height = page.page_size
+        x, y, draw_width, draw_height = page.image_box
+        if page.palette is not None:
+            procset = "ImageI"
+        elif page.color_space == "DeviceGray":
+            procset = "ImageB"
+        else:
+            procset = "ImageC"
+
+        image_ref = self._images.get(page.digest) if page.digest is not None else None
+        if image_ref is None:
+            image_ref = self._write_image(page)
+            if page.digest is not None:
+                self._images[page.digest] = self._new_images[page.digest] = image_ref
+
+        contents = b"q %f 0 0 %f %f %f cm /image Do Q\n" % (draw_width, draw_height, x, y)
+        contents_ref = self._write_object(None, {}, stream=contents)
+
+        page_ref = self._write_object(None, {
+            "Type": PdfParser.PdfName("Page"),
+            "Parent": self._pages_ref,
+            "Resources": {
+                "ProcSet": [PdfParser.PdfName("PDF"), PdfParser.PdfName(procset)],
+                "XObject": {"image": image_ref},
+            },
+            "MediaBox": [0, 0, width, height],
+            "Contents": contents_ref,
+        })
+        self._page_refs.append(page_ref)
+        self.page_count += 1
+
+    def _write_image(self, page):
+        """Write a page's image XObject and return its reference"""
+        if page.data is None:
+            raise ValueError("shared page added before the page that carries its image")
+        color_space = PdfParser.PdfName(page.color_space)
+        if page.palette is not None:
+            color_space = [PdfParser.PdfName("Indexed"), color_space,
+                           len(page.palette) // 3 - 1, PdfParser.PdfBinary(page.palette)]
+
+        image = {
+            "Type": PdfParser.PdfName("XObject"),
+            "Subtype": PdfParser.PdfName("Image"),
+            "Width": page.width,
+            "Height": page.height,
+            "ColorSpace": color_space,
+            "BitsPerComponent": page.bits_per_component,
+            "Filter": PdfParser.PdfName(page.filter_name),
+        }
+        if page.decode_parms is not None:
+            image["DecodeParms"] = page.decode_parms
+        return self._write_object(None, image, stream=page.data)
+
+    def close(self):
+        """Write the page tree, catalog and cross-reference table, then move the file into place"""
+        if self._base is not None:
+            self._close_update()
+            self._finish()
+            return
+
+        self._write_object(self._pages_ref, {
+            "Type": PdfParser.PdfName("Pages"),
+            "Count": len(self._page_refs),
+            "Kids": self._page_refs,
+        })
+        root_ref = self._write_object(None, {
+            "Type": PdfParser.PdfName("Catalog"),
+            "Pages": self._pages_ref,
+        })
+        now = time.gmtime()
+        info_ref = self._write_object(None, {
+            "Title": os.path.splitext(os.path.basename(self.output_file))[0],
+            "CreationDate": now,
+            "ModDate": now,
+        })
+        self._write_xref({
+            "Size": self._next_object_id,
+            "Root": root_ref,
+            "Info": info_ref,
+        })
+        self._finish()
+
+    def _close_update(self):
+        """Finish an incremental update of an existing document"""
+        base = self._base
+        # New pages hang off one intermediate node, so the existing root only gains one kid
+        self._write_object(self._pages_ref, {
+            "Type": PdfParser.PdfName("Pages"),
+            "Parent": base.pages_ref,
+            "Count": len(self._page_refs),
+            "Kids": self._page_refs,
+        })
+        page_tree_root = dict(base.page_tree_root)
+        page_tree_root[b"Kids"] = list(page_tree_root[b"Kids"]) + [self._pages_ref]
+        page_tree_root[b"Count"] = page_tree_root[b"Count"] + len(self._page_refs)
+        self._write_object(base.pages_ref, page_tree_root)
+
+        info = dict(base.info)
+        info[b"ModDate"] = time.gmtime()
+        info_ref = self._write_object(base.info_ref, info)
+        self._write_xref({
+            "Size": self._next_object_id,
+            "Root": base.root_ref,
+            "Info": info_ref,
+            "Prev": base.prev,
+        })
+
+    def _write_xref(self, trailer):
+        """Write an xref section for the objects written so far, then the trailer"""
+        start_xref = self._file.tell()
+        self._file.write(b"xref\n0 1\n0000000000 65535 f \n")
+        # One subsection per run of consecutive object numbers
+        object_ids = sorted(self._offsets)
+        first = 0
+        for i in range(1, len(object_ids) + 1):
+            if i == len(object_ids) or object_ids[i] != object_ids[i - 1] + 1:
+                self._file.write(b"%d %d\n" % (object_ids[first], i - first))
+                for object_id in object_ids[first:i]:
+                    self._file.write(b"%010d %05d n \n" % self._offsets[object_id])
+                first = i
+        self._file.write(b"trailer\n")
+        self._file.write(PdfParser.pdf_repr(trailer))
+        self._file.write(b"\nstartxref\n%d\n%%%%EOF\n" % start_xref)
+
+    def _finish(self):
+        """Make the finished file durable, then move it into place"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        if self._path != self.output_file:
+            os.replace(self._path, self.output_file)
+
+    def suspend(self):
+        """Close the file, keeping the partial output for a writer resumed from checkpoints"""
+        if self._base is not None:
+            self.abort()
+            return
+        self._file.close()
+
+    def abort(self):
+        """Close the file and remove the partially written output"""
+        if self._base is not None:
+            # Drop the partial update and leave the existing document as it was
+            self._file.truncate(self._append_offset)
+            self._file.close()
+            return
+        self._file.close()
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
@@ -0,0 +1,120 @@
+"""
+Folder scanning and image header probing for Image to PDF Converter
+Directories are walked with os.scandir and every candidate is probed in
+parallel, so unreadable files are flagged before a conversion starts.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from engine import is_image_file
+
+# Number of probed files handed back to the caller at a time
+BATCH_SIZE = 64
+
+# Probing is mostly file I/O, so it uses threads rather than processes
+DEFAULT_PROBE_WORKERS = 8
+
+# Bytes at the end of a JPEG searched for the end-of-image marker
+JPEG_TAIL_BYTES = 1024
+
+
+class ImageInfo:
+    """What a header probe learned about one file"""
+
+    def __init__(self, path, file_size=None, format=None, width=None, height=None,
+                 mode=None, error=None):
+        self.path = path
+        self.file_size = file_size
+        self.format = format
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def metadata(self):
+        """Details in the form stored by the persistent cache"""
+        return {
+            'width': self.width,
+            'height': self.height,
+            'mode': self.mode,
+            'format': self.format,
+            'file_size': self.file_size,
+        }
+
+
+def scan_directory(directory, recursive=True):
+    """Yield image files under directory, sorted by name within each folder
+
+    Symlinked folders are followed, but each folder is only visited once, so
+    a link back up the tree (d/up -> ..) doesn't list its files again.
+    """
+    pending = [directory]
+    visited = set()
+    while pending:
+        current = pending.pop()
+        try:
+            stat = os.stat(current)
+            identity = (stat.st_dev, stat.st_ino) if stat.st_ino else os.path.realpath(current)
+            if identity in visited:
+                continue
+            visited.add(identity)
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda e: e.name.lower())
+        except OSError:
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if recursive:
+                        subdirectories.append(entry.path)
+                elif entry.is_file() and is_image_file(entry.name):
+                    yield entry.path
+            except OSError:
+                continue
+        # Visit subfolders in name order after the files of this folder
+        pending.extend(reversed(subdirectories))
+
+
+def probe_image(path):
+    """Read an image header and check the file is complete enough to convert"""
+    try:
+        file_size = os.path.getsize(path)
+        with Image.open(path) as img:
+            info = ImageInfo(path, file_size, img.format, img.width, img.height, img.mode)
+            if img.format == "JPEG":
+                # A complete JPEG ends with an EOI marker (allowing for trailing padding)
+                with open(path, "rb") as f:
+                    f.seek(max(0, file_size - JPEG_TAIL_BYTES))
+                    if b"\xff\xd9" not in f.read():
+                        info.error = "truncated JPEG"
+            else:
+                # Checks chunk CRCs / structure where the format supports it
+                img.verify()
+        return info
+    except Exception as e:
+        return ImageInfo(path, error=str(e) or type(e).__name__)
+
+
+def probe_images(paths, workers=DEFAULT_PROBE_WORKERS, batch_size=BATCH_SIZE, cancel_event=None):
+    """Probe paths in parallel, yielding lists of ImageInfo in input order"""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch = []
+        for path in paths:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            batch.append(path)
+            if len(batch) >= batch_size:
+                yield list(executor.map(probe_image, batch))
+                batch = []
+        if batch:
+            yield list(executor.map(probe_image, batch))
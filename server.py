@@ -0,0 +1,909 @@
+#!/usr/bin/env python3
+"""
+HTTP conversion service for Image to PDF Converter
+Lets other tools on the same machine convert images without the desktop app:
+
+    python server.py --port 8765 --allow-dir /srv/scans
+
+    curl -F file=@scan1.jpg -F file=@scan2.jpg http://127.0.0.1:8765/convert -o scans.pdf
+    curl -X POST -H "Content-Type: application/json" -d '{"paths": ["/srv/scans/today"]}' \\
+         "http://127.0.0.1:8765/jobs?page_size=a4"
+
+Endpoints:
+
+    POST   /jobs             queue a job; returns its status (202)
+    POST   /convert          queue a job and stream its PDF in the response
+    GET    /jobs             status of every job still held
+    GET    /jobs/<id>        status of one job
+    GET    /jobs/<id>/pdf    the PDF, streamed while it is written
+    GET    /jobs/<id>/report stage timings of a finished job (instrumentation.JobReport)
+    DELETE /jobs/<id>        cancel a job, or drop a finished one
+    GET    /metrics          queue and throughput counters
+
+A job is either a multipart/form-data upload of image files or a JSON body
+{"paths": [...], "recursive": false} naming files, directories or glob
+patterns on this machine (only below the --allow-dir directories). Query
+parameters choose the encoding: page_size, dpi, compression, jpeg_quality,
+frames, sort, reverse and strict, as on the command line.
+
+Jobs run on a fixed number of slots that share the encoder processes; when
+--queue jobs are already waiting, new ones are turned away with 503 and a
+Retry-After header instead of piling up. Uploads are written to disk as they
+arrive and the PDF is sent as its pages are written, so neither is held in
+memory. The service listens on localhost only unless told otherwise.
+"""
+
+import argparse
+import email.parser
+import email.policy
+import json
+import logging
+import os
+import re
+import secrets
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from cli import InputError, add_encoding_options, encoding_options, expand_inputs, parse_size
+from engine import (ConversionCancelled, convert_images, is_image_file, parse_frame_ranges,
+                    sort_images)
+from instrumentation import JobReport
+from pdf_writer import COMPRESSION_PROFILES, PAGE_SIZES, PARTIAL_SUFFIX, PageLayout
+from sort_index import SORT_ORDERS
+
+log = logging.getLogger("server")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Conversions running at once, and jobs allowed to wait for a slot
+DEFAULT_JOBS = 2
+DEFAULT_MAX_QUEUED = 8
+
+# Per-job limits
+DEFAULT_MAX_FILES = 500
+DEFAULT_MAX_UPLOAD_BYTES = 1024 ** 3
+MAX_JSON_BYTES = 1024 ** 2
+
+# Seconds a finished job's PDF stays available for download
+DEFAULT_KEEP_SECONDS = 600
+
+# Suggested wait for a client turned away because the queue is full
+RETRY_AFTER_SECONDS = 5
+
+# Bytes read from uploads and from the PDF being written at a time
+CHUNK_SIZE = 64 * 1024
+
+# Longest part header block accepted in a multipart upload
+MAX_PART_HEADER_BYTES = 16 * 1024
+
+# Windows can't rename a file another handle has open, so there the PDF is
+# only sent once it is complete
+STREAM_PARTIAL = os.name != "nt"
+
+# Job states; the last three are final and match JobReport's status
+QUEUED, RUNNING, OK, FAILED, CANCELLED = 'queued', 'running', 'ok', 'failed', 'cancelled'
+FINAL_STATES = (OK, FAILED, CANCELLED)
+
+
+class RequestError(Exception):
+    """A request the service refuses, answered with status and message"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+def job_options(query):
+    """Turn query parameters into convert_images settings, raising RequestError for bad ones
+
+    Returns (options, sort order, reverse); options only holds what the
+    request sets, so the service's defaults apply to the rest.
+    """
+    def value(name):
+        values = query.get(name)
+        return values[-1] if values else None
+
+    def number(name):
+        text = value(name)
+        if text is None:
+            return None
+        if not text.isdigit():
+            raise ValueError(f"{name} must be a whole number")
+        return int(text)
+
+    def flag(name):
+        text = value(name)
+        return text is not None and text.lower() in ('', '1', 'true', 'yes', 'on')
+
+    options = {}
+    try:
+        page_size = value('page_size') or 'native'
+        if page_size != 'native' and page_size not in PAGE_SIZES:
+            raise ValueError(f"unknown page_size: {page_size}")
+        dpi = number('dpi')
+        if dpi == 0:
+            raise ValueError("dpi must be at least 1")
+        if value('page_size') or dpi:
+            options['layout'] = (None if page_size == 'native' else page_size, dpi or None)
+
+        compression = value('compression')
+        if compression is not None and compression not in COMPRESSION_PROFILES:
+            raise ValueError(f"unknown compression: {compression}")
+        jpeg_quality = number('jpeg_quality')
+        if jpeg_quality is not None:
+            if not 1 <= jpeg_quality <= 95:
+                raise ValueError("jpeg_quality must be between 1 and 95")
+        if compression is not None or jpeg_quality is not None:
+            options['profile'] = (compression, jpeg_quality)
+
+        if value('frames'):
+            options['frames'] = parse_frame_ranges(value('frames'))
+        order = value('sort') or 'input'
+        if order not in SORT_ORDERS:
+            raise ValueError(f"unknown sort: {order}")
+    except ValueError as e:
+        raise RequestError(HTTPStatus.BAD_REQUEST, str(e))
+    if flag('strict'):
+        options['skip_errors'] = False
+    return options, order, flag('reverse')
+
+
+def resolve_options(options, defaults):
+    """Fill request options in over the service defaults (see job_options)"""
+    resolved = dict(defaults)
+    resolved.update(options)
+    if 'layout' in options:
+        page_size, dpi = options['layout']
+        resolved['layout'] = PageLayout(page_size, dpi or defaults['layout'].dpi)
+    if 'profile' in options:
+        compression, jpeg_quality = options['profile']
+        profile = COMPRESSION_PROFILES[compression] if compression else defaults['profile']
+        resolved['profile'] = profile.with_quality(jpeg_quality) if jpeg_quality else profile
+    return resolved
+
+
+def read_multipart(read, boundary, open_part):
+    """Split a multipart/form-data body into its parts, a chunk at a time
+
+    read(n) returns up to n more bytes of the body. open_part(headers) is
+    called at the start of each part with its headers (an email.message.Message)
+    and returns a file to write the part's data to, or None to drop it; the
+    file is closed at the end of the part.
+    """
+    delimiter = b"\r\n--" + boundary
+    # Leftover bytes that may be the start of a delimiter are kept back
+    keep = len(delimiter) + 1
+    # The first delimiter has no line break in front of it
+    buffer = b"\r\n"
+    sink = None
+    eof = False
+
+    def fill():
+        nonlocal buffer, eof
+        chunk = read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        buffer += chunk
+
+    try:
+        while True:
+            index = buffer.find(delimiter)
+            if index < 0:
+                if len(buffer) > keep:
+                    if sink is not None:
+                        sink.write(buffer[:-keep])
+                    buffer = buffer[-keep:]
+                if eof:
+                    raise ValueError("form data ends in the middle of a part")
+                fill()
+                continue
+
+            if sink is not None:
+                sink.write(buffer[:index])
+                sink.close()
+                sink = None
+            buffer = buffer[index + len(delimiter):]
+            while len(buffer) < 2 and not eof:
+                fill()
+            if buffer.startswith(b"--"):
+                return
+
+            while b"\r\n\r\n" not in buffer:
+                if eof or len(buffer) > MAX_PART_HEADER_BYTES:
+                    raise ValueError("malformed part headers in form data")
+                fill()
+            head, buffer = buffer.split(b"\r\n\r\n", 1)
+            # Drop the rest of the delimiter line (line break, maybe padding)
+            head = head.partition(b"\r\n")[2]
+            headers = email.parser.BytesHeaderParser(policy=email.policy.HTTP).parsebytes(head)
+            sink = open_part(headers)
+    finally:
+        if sink is not None:
+            sink.close()
+
+
+def upload_name(file_name):
+    """A safe local name for an uploaded file, or None if it isn't an image"""
+    # Some browsers send the client-side path; keep the last component
+    name = re.split(r"[\\/]", file_name or "")[-1].strip()
+    name = re.sub(r"[\x00-\x1f]", "", name)
+    if not name or name.startswith(".") or not is_image_file(name):
+        return None
+    return name
+
+
+class Job:
+    """One conversion request and everything known about its progress
+
+    Threads waiting for the job (a client streaming its PDF) block in
+    wait_for_change() until version moves on, which it does after every page
+    and when the job ends.
+    """
+
+    def __init__(self, job_id, directory, options, order='input', reverse=False):
+        self.id = job_id
+        self.directory = directory
+        self.options = options
+        self.order = order
+        self.reverse = reverse
+        self.state = QUEUED
+        self.image_files = []
+        # Name shown for each input: the upload's file name or the server path
+        self.names = {}
+        self.uploaded = False
+        self.output_file = os.path.join(directory, "output.pdf")
+        self.pages_done = 0
+        self.pages_total = None
+        self.page_count = None
+        self.skipped = []
+        self.error = None
+        self.report = JobReport()
+        self.cancel_event = threading.Event()
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.version = 0
+        self._changed = threading.Condition()
+
+    @property
+    def done(self):
+        return self.state in FINAL_STATES
+
+    def add_file(self, path, name=None):
+        self.image_files.append(path)
+        self.names[path] = name or path
+
+    def progress(self, done, total, image_file):
+        with self._changed:
+            self.pages_done = done
+            self.pages_total = total
+            self.version += 1
+            self._changed.notify_all()
+
+    def skip(self, image_file, reason):
+        self.skipped.append({'image': self.names.get(image_file, image_file),
+                             'reason': self.display(reason)})
+
+    def display(self, message):
+        """message with upload paths replaced by the client's file names"""
+        if self.uploaded:
+            # Don't show clients where their uploads were stored
+            for path, name in self.names.items():
+                message = message.replace(path, name)
+        return message
+
+    def set_state(self, state, error=None):
+        with self._changed:
+            self.state = state
+            self.error = error
+            if state == RUNNING:
+                self.started = time.time()
+            elif state in FINAL_STATES:
+                self.finished = time.time()
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, version, timeout=1.0):
+        """Wait until the job changes after version was read, or for timeout seconds"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+
+    def open_output(self):
+        """Open the PDF for reading once its first page is written; None if the job ended without one
+
+        Waiting for a page (rather than just the file) means a job that fails
+        at its first image is answered with an error instead of a cut-off PDF.
+        """
+        while True:
+            version, state = self.version, self.state
+            if state == OK:
+                return open(self.output_file, "rb")
+            if state in (FAILED, CANCELLED):
+                return None
+            if state == RUNNING and STREAM_PARTIAL and self.report.pages:
+                try:
+                    # Still readable after the writer renames it into place
+                    return open(self.output_file + PARTIAL_SUFFIX, "rb")
+                except FileNotFoundError:
+                    pass
+            self.wait_for_change(version)
+
+    def to_dict(self):
+        output_bytes = None
+        if self.state == OK:
+            try:
+                output_bytes = os.path.getsize(self.output_file)
+            except OSError:
+                pass
+        return {
+            'id': self.id,
+            'state': self.state,
+            'images': len(self.image_files),
+            'pages_done': self.pages_done,
+            'pages_total': self.pages_total,
+            'pages': self.page_count,
+            'skipped': self.skipped,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'output_bytes': output_bytes,
+            'pdf': f"/jobs/{self.id}/pdf",
+        }
+
+
+class ConversionQueue:
+    """Jobs waiting for and running on a fixed number of conversion slots
+
+    Each running job gets workers // jobs encoder processes. A job is
+    admitted by new_job() (before its upload arrives) if it can start on an
+    idle slot or take one of max_queued places behind the busy ones;
+    otherwise new_job() refuses with 503. Finished jobs are kept keep_seconds for their PDF
+    and status, then deleted; jobs running longer than timeout seconds are
+    cancelled.
+    """
+
+    def __init__(self, work_dir, jobs=DEFAULT_JOBS, max_queued=DEFAULT_MAX_QUEUED,
+                 keep_seconds=DEFAULT_KEEP_SECONDS, timeout=None, **defaults):
+        self.work_dir = work_dir
+        self.jobs = jobs
+        self.max_queued = max_queued
+        self.keep_seconds = keep_seconds
+        self.timeout = timeout
+        workers = defaults.pop('workers', None) or os.cpu_count() or 1
+        defaults['workers'] = max(1, workers // jobs)
+        self.defaults = defaults
+        self._executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        # Jobs handed out by new_job() that are not running or finished yet
+        self._waiting = set()
+        self._running = 0
+        self._started = time.time()
+        self.counters = {
+            'submitted': 0, 'rejected': 0, OK: 0, FAILED: 0, CANCELLED: 0,
+            'pages_written': 0, 'images_skipped': 0, 'bytes_uploaded': 0,
+            'bytes_sent': 0, 'output_bytes': 0, 'conversion_seconds': 0.0,
+        }
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def new_job(self, options, order='input', reverse=False):
+        """Reserve a queue place for a job whose inputs are about to be read"""
+        self.expire()
+        with self._lock:
+            self._check_capacity()
+            job_id = secrets.token_hex(8)
+            directory = os.path.join(self.work_dir, job_id)
+            os.makedirs(directory)
+            job = Job(job_id, directory, resolve_options(options, self.defaults), order, reverse)
+            self._waiting.add(job_id)
+        return job
+
+    def check_capacity(self):
+        """Raise RequestError (503) if no more jobs may queue right now"""
+        with self._lock:
+            self._check_capacity()
+
+    def _check_capacity(self):
+        # Admitted jobs beyond the slot count are the ones that have to wait
+        if self._running + len(self._waiting) >= self.jobs + self.max_queued:
+            self.counters['rejected'] += 1
+            raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE,
+                               f"all {self.jobs} slots are busy and {self.max_queued} jobs are waiting, "
+                               f"try again later",
+                               {'Retry-After': str(RETRY_AFTER_SECONDS)})
+
+    def discard(self, job):
+        """Give up a job from new_job() that could not be submitted"""
+        with self._lock:
+            self._waiting.discard(job.id)
+        shutil.rmtree(job.directory, ignore_errors=True)
+
+    def submit(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self.counters['submitted'] += 1
+        self._executor.submit(self._run, job)
+        log.info("job %s: queued %d image%s", job.id, len(job.image_files),
+                 "s" if len(job.image_files) != 1 else "")
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise RequestError(HTTPStatus.NOT_FOUND, f"no job {job_id}")
+        return job
+
+    def all(self):
+        self.expire()
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job):
+        """Stop a waiting or running job, or delete a finished one"""
+        if job.done:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            shutil.rmtree(job.directory, ignore_errors=True)
+        else:
+            job.cancel_event.set()
+            # A job that hasn't started is stopped by _run before it converts anything
+
+    def expire(self, now=None):
+        """Delete finished jobs older than keep_seconds"""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.done and now - job.finished >= self.keep_seconds]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.directory, ignore_errors=True)
+
+    def metrics(self):
+        jobs = self.all()
+        with self._lock:
+            counters = dict(self.counters)
+            waiting = len(self._waiting)
+        seconds = counters.pop('conversion_seconds')
+        return {
+            'uptime_seconds': round(time.time() - self._started, 3),
+            'job_slots': self.jobs,
+            'workers_per_job': self.defaults['workers'],
+            'queue_limit': self.max_queued,
+            'queued': waiting,
+            'running': sum(1 for job in jobs if job.state == RUNNING),
+            'jobs': {name: counters.pop(name) for name in ('submitted', 'rejected', OK, FAILED, CANCELLED)},
+            **counters,
+            'conversion_seconds': round(seconds, 3),
+            'pages_per_second': round(counters['pages_written'] / seconds, 3) if seconds else None,
+        }
+
+    def close(self):
+        """Cancel every job and wait for the running ones to stop"""
+        for job in self.all():
+            job.cancel_event.set()
+        self._executor.shutdown(wait=True)
+
+    def _run(self, job):
+        with self._lock:
+            self._waiting.discard(job.id)
+            if job.cancel_event.is_set():
+                cancelled = True
+            else:
+                cancelled = False
+                self._running += 1
+        if cancelled:
+            job.set_state(CANCELLED)
+            self._finished(job)
+            return
+
+        job.set_state(RUNNING)
+        timer = None
+        if self.timeout:
+            timer = threading.Timer(self.timeout, job.cancel_event.set)
+            timer.daemon = True
+            timer.start()
+        try:
+            image_files = sort_images(job.image_files, job.order, job.reverse)
+            job.page_count = convert_images(image_files, job.output_file, progress=job.progress,
+                                            cancel_event=job.cancel_event, report=job.report,
+                                            on_skip=job.skip, resume=False, **job.options)
+        except ConversionCancelled:
+            if timer is not None and not timer.is_alive():
+                job.set_state(FAILED, f"timed out after {self.timeout:g}s")
+            else:
+                job.set_state(CANCELLED)
+        except Exception as e:
+            job.set_state(FAILED, job.display(str(e) or type(e).__name__))
+        else:
+            job.set_state(OK)
+        finally:
+            if timer is not None:
+                timer.cancel()
+        self._finished(job)
+
+    def _finished(self, job):
+        if job.uploaded:
+            shutil.rmtree(os.path.join(job.directory, "uploads"), ignore_errors=True)
+        if job.state != OK:
+            # Partial output and journal are of no use to anyone
+            shutil.rmtree(job.directory, ignore_errors=True)
+
+        with self._lock:
+            if job.started is not None:
+                self._running -= 1
+            self.counters[job.state] += 1
+            self.counters['images_skipped'] += len(job.skipped)
+            self.counters['pages_written'] += job.page_count or 0
+            if job.started is not None:
+                self.counters['conversion_seconds'] += job.finished - job.started
+            if job.state == OK:
+                self.counters['output_bytes'] += job.to_dict()['output_bytes'] or 0
+        log.log(logging.WARNING if job.state == FAILED else logging.INFO, "job %s: %s%s",
+                job.id, job.state, f" ({job.error})" if job.error else "")
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """HTTP server holding the job queue and the rules for server-side paths"""
+
+    daemon_threads = True
+
+    def __init__(self, address, queue, allowed_dirs=(), max_files=DEFAULT_MAX_FILES,
+                 max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES):
+        super().__init__(address, ConversionHandler)
+        self.queue = queue
+        self.allowed_dirs = [os.path.realpath(directory) for directory in allowed_dirs]
+        self.max_files = max_files
+        self.max_upload_bytes = max_upload_bytes
+
+    def allowed(self, path):
+        """Check that a server-side path lies below one of the allowed directories"""
+        path = os.path.realpath(path)
+        return any(os.path.commonpath([path, directory]) == directory
+                   for directory in self.allowed_dirs)
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    """Routes requests to the job queue; one instance per connection"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "ImageToPDF"
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        log.debug("%s %s", self.address_string(), format % args)
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = parse_qs(url.query, keep_blank_values=True)
+        queue = self.server.queue
+        try:
+            if method == 'POST' and parts in (['jobs'], ['convert']):
+                job = self.create_job(query)
+                if parts == ['convert']:
+                    self.send_pdf(job, cancel_on_disconnect=True)
+                else:
+                    self.send_json(HTTPStatus.ACCEPTED, job.to_dict(),
+                                   {'Location': f"/jobs/{job.id}"})
+            elif method == 'GET' and parts == ['jobs']:
+                self.send_json(HTTPStatus.OK, {'jobs': [job.to_dict() for job in queue.all()]})
+            elif method == 'GET' and parts == ['metrics']:
+                self.send_json(HTTPStatus.OK, queue.metrics())
+            elif method == 'GET' and len(parts) == 2 and parts[0] == 'jobs':
+                self.send_json(HTTPStatus.OK, queue.get(parts[1]).to_dict())
+            elif method == 'GET' and len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'pdf':
+                self.send_pdf(queue.get(parts[1]))
+            elif method == 'GET' and len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'report':
+                job = queue.get(parts[1])
+                if not job.done:
+                    raise RequestError(HTTPStatus.CONFLICT, f"job {job.id} is still {job.state}")
+                self.send_json(HTTPStatus.OK, job.report.to_dict())
+            elif method == 'DELETE' and len(parts) == 2 and parts[0] == 'jobs':
+                job = queue.get(parts[1])
+                queue.cancel(job)
+                self.send_json(HTTPStatus.OK, job.to_dict())
+            else:
+                raise RequestError(HTTPStatus.NOT_FOUND, f"no such endpoint: {method} {url.path}")
+        except RequestError as e:
+            # A refused POST may leave part of its body unread
+            self.send_error_json(e, close=method == 'POST')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def handle_expect_100(self):
+        """Refuse a job before the client sends its body (full queue, too large, ...)"""
+        url = urlsplit(self.path)
+        if self.command == 'POST' and url.path.strip("/") in ('jobs', 'convert'):
+            try:
+                self.check_job_request(parse_qs(url.query, keep_blank_values=True))
+                self.server.queue.check_capacity()
+            except RequestError as e:
+                self.send_error_json(e, close=True)
+                return False
+        return super().handle_expect_100()
+
+    def check_job_request(self, query):
+        """Validate a job request from its headers alone
+
+        Returns the job options (see job_options), the body length and the
+        method that reads the inputs from the body.
+        """
+        options = job_options(query)
+        length = self.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            raise RequestError(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+        length = int(length)
+        content_type = self.headers.get_content_type()
+        if content_type == 'multipart/form-data':
+            if length > self.server.max_upload_bytes:
+                raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                   f"upload is larger than {self.server.max_upload_bytes} bytes")
+            read_inputs = self.read_uploads
+        elif content_type == 'application/json':
+            if length > MAX_JSON_BYTES:
+                raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "request body is too large")
+            read_inputs = self.read_paths
+        else:
+            raise RequestError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+                               "send multipart/form-data image uploads or a JSON list of paths")
+        return options, length, read_inputs
+
+    def create_job(self, query):
+        """Read a job's inputs from the request body and queue it"""
+        (options, order, reverse), length, read_inputs = self.check_job_request(query)
+        queue = self.server.queue
+        job = queue.new_job(options, order, reverse)
+        try:
+            read_inputs(job, length)
+            if not job.image_files:
+                raise RequestError(HTTPStatus.BAD_REQUEST, "no images in the request")
+        except BaseException:
+            queue.discard(job)
+            raise
+        queue.submit(job)
+        return job
+
+    def read_uploads(self, job, length):
+        """Write the uploaded files of a multipart body into the job directory"""
+        boundary = self.headers.get_param('boundary')
+        if not boundary:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "multipart body without a boundary")
+        remaining = length
+        max_files = self.server.max_files
+        job.uploaded = True
+
+        def read(size):
+            nonlocal remaining
+            data = self.rfile.read(min(size, remaining))
+            remaining -= len(data)
+            return data
+
+        def open_part(headers):
+            file_name = headers.get_filename()
+            if file_name is None:
+                # A plain form field, not a file
+                return None
+            name = upload_name(file_name)
+            if name is None:
+                raise RequestError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, f"not an image file: {file_name}")
+            if len(job.image_files) >= max_files:
+                raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                   f"more than {max_files} files in one job")
+            # One directory per upload keeps the client's file names without clashes
+            directory = os.path.join(job.directory, "uploads", f"{len(job.image_files) + 1:05d}")
+            os.makedirs(directory)
+            path = os.path.join(directory, name)
+            job.add_file(path, name)
+            return open(path, "wb")
+
+        try:
+            read_multipart(read, boundary.encode("latin-1"), open_part)
+        except ValueError as e:
+            raise RequestError(HTTPStatus.BAD_REQUEST, str(e))
+        self.server.queue.count('bytes_uploaded', length - remaining)
+
+    def read_paths(self, job, length):
+        """Add the server-side files named in a JSON body to the job"""
+        try:
+            body = json.loads(self.rfile.read(length))
+            paths = body['paths']
+            if isinstance(paths, str) or not all(isinstance(path, str) for path in paths):
+                raise TypeError
+        except (ValueError, KeyError, TypeError):
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'expected {"paths": ["file, directory or glob", ...]}')
+        if not self.server.allowed_dirs:
+            raise RequestError(HTTPStatus.FORBIDDEN, "server-side paths are not enabled (see --allow-dir)")
+        for path in paths:
+            if not self.server.allowed(path):
+                raise RequestError(HTTPStatus.FORBIDDEN, f"not in an allowed directory: {path}")
+
+        try:
+            image_files = expand_inputs(paths, bool(body.get('recursive')))
+        except (InputError, OSError) as e:
+            raise RequestError(HTTPStatus.BAD_REQUEST, str(e))
+        # Globs and symlinks may lead outside the directories the paths were in
+        outside = [path for path in image_files if not self.server.allowed(path)]
+        if outside:
+            raise RequestError(HTTPStatus.FORBIDDEN, f"not in an allowed directory: {outside[0]}")
+        if len(image_files) > self.server.max_files:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                               f"more than {self.server.max_files} files in one job")
+        for path in image_files:
+            job.add_file(path)
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data, indent=2).encode("utf-8") + b"\n"
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, error, close=False):
+        headers = dict(error.headers)
+        if close:
+            headers['Connection'] = 'close'
+        self.send_json(error.status, {'error': error.message}, headers)
+
+    def send_pdf(self, job, cancel_on_disconnect=False):
+        """Send the job's PDF with chunked encoding, following the file as pages are written
+
+        If the job fails after the first bytes went out, the response ends
+        without its final chunk so the client sees a truncated transfer
+        rather than a damaged PDF.
+        """
+        try:
+            f = job.open_output()
+        except BaseException:
+            if cancel_on_disconnect:
+                job.cancel_event.set()
+            raise
+        if f is None:
+            raise RequestError(HTTPStatus.CONFLICT, f"job {job.id} {job.state}: {job.error or 'no output'}")
+
+        sent = 0
+        try:
+            with f:
+                self.send_response(HTTPStatus.OK)
+                self.send_header('Content-Type', 'application/pdf')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.send_header('Content-Disposition', f'attachment; filename="{job.id}.pdf"')
+                self.send_header('X-Job-Id', job.id)
+                self.end_headers()
+                while True:
+                    # Read the state first: once the job is final, everything is on disk
+                    version, final = job.version, job.done
+                    data = f.read(CHUNK_SIZE)
+                    if data:
+                        self.wfile.write(b"%x\r\n" % len(data))
+                        self.wfile.write(data)
+                        self.wfile.write(b"\r\n")
+                        sent += len(data)
+                    elif final:
+                        break
+                    else:
+                        job.wait_for_change(version)
+            if job.state != OK:
+                self.close_connection = True
+                return
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            if cancel_on_disconnect:
+                job.cancel_event.set()
+            raise
+        finally:
+            self.server.queue.count('bytes_sent', sent)
+
+
+def build_parser():
+    """Create the argument parser"""
+    parser = argparse.ArgumentParser(
+        description="Serve image to PDF conversions over HTTP on this machine."
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help=f"address to listen on (default: {DEFAULT_HOST}, this machine only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"port to listen on, 0 for any free one (default: {DEFAULT_PORT})")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"conversions running at once; encoder processes are divided "
+                             f"between them (default: {DEFAULT_JOBS})")
+    parser.add_argument("--queue", type=int, default=DEFAULT_MAX_QUEUED, metavar="N",
+                        help=f"jobs allowed to wait for a free slot before new ones are turned "
+                             f"away; 0 only accepts jobs that can start at once "
+                             f"(default: {DEFAULT_MAX_QUEUED})")
+    parser.add_argument("--max-files", type=int, default=DEFAULT_MAX_FILES, metavar="N",
+                        help=f"most images in one job (default: {DEFAULT_MAX_FILES})")
+    parser.add_argument("--max-upload", type=parse_size, default=DEFAULT_MAX_UPLOAD_BYTES,
+                        metavar="SIZE", help="largest upload accepted for one job, e.g. 200M (default: 1G)")
+    parser.add_argument("--timeout", type=float, default=None, metavar="SECONDS",
+                        help="fail jobs that run longer than this (default: no limit)")
+    parser.add_argument("--keep", type=float, default=DEFAULT_KEEP_SECONDS, metavar="SECONDS",
+                        help=f"how long finished PDFs stay available (default: {DEFAULT_KEEP_SECONDS})")
+    parser.add_argument("--allow-dir", action="append", default=[], metavar="DIRECTORY",
+                        help="directory whose images jobs may name by path (repeatable; "
+                             "default: uploads only)")
+    parser.add_argument("--work-dir", default=None,
+                        help="directory for uploads and finished PDFs (default: a temporary directory)")
+    add_encoding_options(parser)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="only log warnings and errors")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    options = encoding_options(parser, args)
+    if args.jobs < 1 or args.queue < 0:
+        parser.error("--jobs must be at least 1 and --queue not negative")
+    if args.max_files < 1:
+        parser.error("--max-files must be at least 1")
+    if (args.timeout is not None and args.timeout <= 0) or args.keep < 0:
+        parser.error("times must be positive")
+    for directory in args.allow_dir:
+        if not os.path.isdir(directory):
+            parser.error(f"not a directory: {directory}")
+
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    if args.host not in ("127.0.0.1", "::1", "localhost"):
+        log.warning("listening on %s: the service has no authentication", args.host)
+
+    temporary = args.work_dir is None
+    work_dir = tempfile.mkdtemp(prefix="img2pdf-") if temporary else args.work_dir
+    os.makedirs(work_dir, exist_ok=True)
+
+    queue = ConversionQueue(work_dir, jobs=args.jobs, max_queued=args.queue,
+                            keep_seconds=args.keep, timeout=args.timeout, **options)
+    try:
+        server = ConversionServer((args.host, args.port), queue, args.allow_dir,
+                                  args.max_files, args.max_upload)
+    except OSError as e:
+        print(f"error: cannot listen on {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 1
+    # Stop cleanly on a service manager's SIGTERM as well as on Ctrl+C
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+
+    host, port = server.server_address[:2]
+    log.info("listening on http://%s:%d/", host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info("interrupted, stopping")
+    finally:
+        server.server_close()
+        queue.close()
+        if temporary:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
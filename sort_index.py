@@ -0,0 +1,189 @@
+"""
+Sort-key index for Image to PDF Converter
+Page orders that depend on file contents (capture time, dimensions) or file
+system details (modification time, size) read those once per file, in
+parallel, and keep them in memory; re-sorting a long list after that never
+touches the disk.
+"""
+
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# Reading headers is mostly file I/O, so it uses threads rather than processes
+DEFAULT_READ_WORKERS = 8
+
+# Formats whose EXIF block sits in the header, so reading it decodes no pixels
+EXIF_FORMATS = ('JPEG', 'MPO', 'TIFF', 'WEBP')
+
+# EXIF tags: the Exif sub-IFD, DateTimeOriginal in it and DateTime in IFD0
+EXIF_IFD = 0x8769
+EXIF_DATE_TIME_ORIGINAL = 36867
+EXIF_DATE_TIME = 306
+
+
+class SortRecord:
+    """Everything the page orders need to know about one file"""
+
+    def __init__(self, path, mtime=0.0, size=0, width=0, height=0, taken=None):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.width = width
+        self.height = height
+        # Capture time (seconds since the epoch, local time) from EXIF, if any
+        self.taken = taken
+
+
+# Stands in for a file that has not been read (or could not be)
+MISSING = SortRecord(None)
+
+
+def parse_exif_time(value):
+    """Convert an EXIF 'YYYY:MM:DD HH:MM:SS' string to a timestamp, or None"""
+    if isinstance(value, bytes):
+        value = value.decode("ascii", "replace")
+    if not isinstance(value, str):
+        return None
+    try:
+        return time.mktime(time.strptime(value.strip().rstrip("\x00")[:19], "%Y:%m:%d %H:%M:%S"))
+    except (ValueError, OverflowError):
+        return None
+
+
+def read_sort_record(path):
+    """Stat a file and read its dimensions and capture time from the header"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return SortRecord(path)
+    record = SortRecord(path, st.st_mtime, st.st_size)
+    try:
+        with Image.open(path) as img:
+            record.width, record.height = img.size
+            if img.format in EXIF_FORMATS:
+                exif = img.getexif()
+                taken = exif.get_ifd(EXIF_IFD).get(EXIF_DATE_TIME_ORIGINAL) or exif.get(EXIF_DATE_TIME)
+                record.taken = parse_exif_time(taken)
+    except Exception:
+        # Unreadable images keep their file details and sort as 0×0 with no capture time
+        pass
+    return record
+
+
+def natural_key(text):
+    """Key that orders embedded numbers by value: scan2 before scan10"""
+    parts = re.split(r"(\d+)", text.lower())
+    # Text and numbers alternate, so equal positions always hold the same type
+    return tuple(int(part) if i % 2 else part for i, part in enumerate(parts))
+
+
+def key_name(path, record):
+    """Case-insensitive file name"""
+    return os.path.basename(path).lower(), path
+
+
+def key_natural(path, record):
+    """File name with numbers compared by value"""
+    return natural_key(os.path.basename(path)), path
+
+
+def key_taken(path, record):
+    """EXIF capture time, falling back to the modification time"""
+    return (record.taken if record.taken is not None else record.mtime), path
+
+
+def key_mtime(path, record):
+    """Last modification time"""
+    return record.mtime, path
+
+
+def key_size(path, record):
+    """File size in bytes"""
+    return record.size, path
+
+
+def key_dimensions(path, record):
+    """Pixel count, then width"""
+    return record.width * record.height, record.width, path
+
+
+# Available page orders ('input' keeps the order the files were given in)
+SORT_ORDERS = {
+    'input': None,
+    'name': key_name,
+    'natural': key_natural,
+    'taken': key_taken,
+    'mtime': key_mtime,
+    'size': key_size,
+    'dimensions': key_dimensions,
+}
+
+# Orders that only look at the path, so they never need the index filled
+PATH_ORDERS = ('input', 'name', 'natural')
+
+
+class SortIndex:
+    """Sort keys for a set of files, read once and kept in memory
+
+    fill() reads the files not indexed yet on a thread pool; sort() fills
+    what it needs and then sorts in memory. The index is safe to fill from a
+    background thread while the UI thread sorts: files not read yet sort as
+    if empty.
+    """
+
+    def __init__(self, workers=DEFAULT_READ_WORKERS):
+        self.workers = workers
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, path):
+        return path in self._records
+
+    def missing(self, paths, order):
+        """Paths that order needs read before it can sort them"""
+        if order in PATH_ORDERS:
+            return []
+        return [path for path in dict.fromkeys(paths) if path not in self._records]
+
+    def fill(self, paths, cancel_event=None):
+        """Read the sort keys of every path not indexed yet, in parallel"""
+        missing = [path for path in dict.fromkeys(paths) if path not in self._records]
+        if not missing:
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for record in executor.map(read_sort_record, missing):
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                with self._lock:
+                    self._records[record.path] = record
+
+    def discard(self, path):
+        """Forget a file, e.g. after it was removed from the list or changed on disk"""
+        with self._lock:
+            self._records.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def key(self, order):
+        """Key function on a path for order, using only what is already indexed"""
+        key = SORT_ORDERS[order]
+        records = self._records
+        return lambda path: key(path, records.get(path, MISSING))
+
+    def sort(self, paths, order='input', reverse=False):
+        """Return paths in the requested order, reading only files not indexed yet"""
+        if SORT_ORDERS[order] is None:
+            return list(reversed(paths)) if reverse else list(paths)
+        if order not in PATH_ORDERS:
+            self.fill(paths)
+        return sorted(paths, key=self.key(order), reverse=reverse)
@@ -0,0 +1,61 @@
+from PIL import GifImagePlugin, Image, ImageDraw
+
+from engine import convert_images
+from pdf_writer import encode_image, encode_images
+
+FRAMES = 40
+
+
+def make_gif(path, count=FRAMES):
+    frames = []
+    for i in range(count):
+        img = Image.new('RGB', (160, 120), (i * 6, 40, 90))
+        ImageDraw.Draw(img).ellipse((i * 3, i * 2, i * 3 + 40, i * 2 + 40), fill=(255, i, 0))
+        frames.append(img.convert('P'))
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=40)
+    return str(path)
+
+
+def count_frame_decodes(monkeypatch):
+    """Count the GIF frames Pillow steps through while seeking"""
+    calls = []
+    original = GifImagePlugin.GifImageFile._seek
+
+    def counting_seek(self, frame, update_image=True):
+        if update_image:
+            calls.append(frame)
+        return original(self, frame, update_image)
+
+    monkeypatch.setattr(GifImagePlugin.GifImageFile, '_seek', counting_seek)
+    return calls
+
+
+def test_gif_frame_cost_does_not_grow_with_index(tmp_path, monkeypatch):
+    path = make_gif(tmp_path / "anim.gif")
+    calls = count_frame_decodes(monkeypatch)
+
+    steps = []
+    for page in encode_images([(path, i) for i in range(FRAMES)], workers=1):
+        steps.append(len(calls))
+        calls.clear()
+
+    # Reaching frame i steps through one frame, not frames 0..i again
+    assert steps == [1] * FRAMES
+
+
+def test_frames_match_single_frame_encodes(tmp_path):
+    path = make_gif(tmp_path / "anim.gif")
+    sources = [(path, 7), (path, 2), (path, 3), (path, 30), (path, 3)]
+
+    pages = list(encode_images(sources, workers=2))
+
+    assert [page.stats.frame for page in pages] == [7, 2, 3, 30, 3]
+    assert pages[4].stats.source == 'shared'
+    for source, page in zip(sources[:4], pages):
+        assert page.data == encode_image(source).data
+
+
+def test_convert_animated_gif(tmp_path):
+    path = make_gif(tmp_path / "anim.gif")
+
+    assert convert_images([path], str(tmp_path / "out.pdf"), workers=2) == FRAMES
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from PIL import Image
+
+import pdf_writer
+from engine import convert_images
+from journal import JOURNAL_SUFFIX
+
+
+def make_images(directory, colors):
+    paths = []
+    for i, color in enumerate(colors):
+        path = os.path.join(directory, f"{i}.png")
+        Image.new('RGB', (64, 48), color).save(path)
+        paths.append(path)
+    return paths
+
+
+def crash_after(monkeypatch, pages):
+    """Make the writer fail once it has written pages pages"""
+    original = pdf_writer.PDFWriter.add_page
+
+    def add_page(self, page):
+        if self.page_count == pages:
+            raise OSError("disk full")
+        return original(self, page)
+
+    monkeypatch.setattr(pdf_writer.PDFWriter, 'add_page', add_page)
+
+
+def written_pages(monkeypatch, image_files, output_file):
+    """Run a conversion and return the sources of the pages it encodes"""
+    encoded = []
+    original = pdf_writer.encode_image
+
+    def encode_image(source, *args):
+        encoded.append(source)
+        return original(source, *args)
+
+    monkeypatch.setattr(pdf_writer, 'encode_image', encode_image)
+    pages = convert_images(image_files, output_file, workers=1)
+    monkeypatch.setattr(pdf_writer, 'encode_image', original)
+    return pages, encoded
+
+
+def test_failed_job_resumes(tmp_path, monkeypatch):
+    image_files = make_images(tmp_path, ['red', 'green', 'blue'])
+    output_file = str(tmp_path / "out.pdf")
+    with monkeypatch.context() as patch:
+        crash_after(patch, 2)
+        with pytest.raises(OSError):
+            convert_images(image_files, output_file, workers=1)
+    assert os.path.exists(output_file + JOURNAL_SUFFIX)
+
+    pages, encoded = written_pages(monkeypatch, image_files, output_file)
+
+    assert pages == 3
+    assert encoded == [(image_files[2], None)]
+    assert not os.path.exists(output_file + JOURNAL_SUFFIX)
+
+
+def test_changed_input_restarts_job(tmp_path, monkeypatch):
+    image_files = make_images(tmp_path, ['red', 'green', 'blue'])
+    output_file = str(tmp_path / "out.pdf")
+    with monkeypatch.context() as patch:
+        crash_after(patch, 2)
+        with pytest.raises(OSError):
+            convert_images(image_files, output_file, workers=1)
+
+    # Same path, new content
+    Image.new('RGB', (80, 60), 'yellow').save(image_files[1])
+    pages, encoded = written_pages(monkeypatch, image_files, output_file)
+
+    assert pages == 3
+    assert [image_file for image_file, frame in encoded] == image_files
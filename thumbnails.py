@@ -0,0 +1,301 @@
+"""
+Preview thumbnails for Image to PDF Converter
+Thumbnails are kept in a bounded LRU cache so re-selecting an image is instant.
+"""
+
+import os
+import queue
+import threading
+from collections import OrderedDict, deque
+from io import BytesIO
+
+from PIL import ExifTags, Image
+
+# Largest preview shown in the thumbnail panel
+THUMBNAIL_SIZE = (250, 250)
+
+# Decode at no less than this multiple of the preview size before the final resize
+REDUCING_GAP = 2
+
+# EXIF IFD1 tags locating the embedded JPEG thumbnail
+EXIF_THUMBNAIL_OFFSET = 0x0201
+EXIF_THUMBNAIL_LENGTH = 0x0202
+
+# OpenJPEG encodes six resolution levels by default, so at most five can be skipped
+JPEG2000_MAX_REDUCE = 5
+
+TIFF_NEW_SUBFILE_TYPE = 254
+
+# How many images on each side of the selection are decoded ahead of time
+PREFETCH_RADIUS = 5
+
+# Memory budget for cached thumbnails (roughly 350 full-size previews)
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class Thumbnail:
+    """A decoded preview plus the details shown under it"""
+
+    def __init__(self, image, width, height, file_size, mode=None, format=None):
+        self.image = image
+        self.width = width
+        self.height = height
+        self.file_size = file_size
+        self.mode = mode
+        self.format = format
+
+    @property
+    def metadata(self):
+        """Details of the source image, as stored in the persistent cache"""
+        return {
+            'width': self.width,
+            'height': self.height,
+            'mode': self.mode,
+            'format': self.format,
+            'file_size': self.file_size,
+        }
+
+    @property
+    def nbytes(self):
+        """Approximate memory used by the preview pixels"""
+        return self.image.width * self.image.height * len(self.image.getbands())
+
+
+def cache_key(image_path):
+    """Key a file on path, mtime and size so edited files are not served stale"""
+    stat = os.stat(image_path)
+    return (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+
+
+def load_thumbnail(image_path, max_size=THUMBNAIL_SIZE, file_size=None):
+    """Decode a reduced-size version of an image and shrink it to fit max_size"""
+    if file_size is None:
+        file_size = os.path.getsize(image_path)
+    with Image.open(image_path) as img:
+        # Details come from the one header parse, before any reduced decoding
+        width, height = img.size
+        mode, format = img.mode, img.format
+        preview = embedded_thumbnail(img, max_size)
+        if preview is None:
+            reduce_decoding(img, max_size)
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            preview = img.copy()
+        else:
+            preview.thumbnail(max_size, Image.Resampling.LANCZOS)
+        return Thumbnail(preview, width, height, file_size, mode, format)
+
+
+def encode_thumbnail(image):
+    """Compress a preview for the persistent cache"""
+    buffer = BytesIO()
+    if image.mode not in ('RGB', 'L', 'RGBA', 'P'):
+        # Neither JPEG nor PNG can hold CMYK, LAB, YCbCr, 16-bit or float pixels
+        image = image.convert('RGBA' if image.mode in ('LA', 'La', 'PA', 'RGBa') else 'RGB')
+    if image.mode in ('RGB', 'L'):
+        image.save(buffer, "JPEG", quality=85)
+    else:
+        image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def decode_thumbnail(data, metadata):
+    """Rebuild a Thumbnail from a persistent cache entry"""
+    image = Image.open(BytesIO(data))
+    image.load()
+    return Thumbnail(image, metadata['width'], metadata['height'], metadata['file_size'],
+                     metadata['mode'], metadata['format'])
+
+
+def covers(size, max_size):
+    """Check whether size is at least as large as the preview needs"""
+    return size[0] >= max_size[0] or size[1] >= max_size[1]
+
+
+def embedded_thumbnail(img, max_size):
+    """Return the EXIF thumbnail if it is big enough and has the right shape"""
+    exif_data = img.info.get("exif")
+    if not exif_data or not exif_data.startswith(b"Exif\x00\x00"):
+        return None
+    try:
+        ifd1 = img.getexif().get_ifd(ExifTags.IFD.IFD1)
+        offset = ifd1[EXIF_THUMBNAIL_OFFSET]
+        length = ifd1[EXIF_THUMBNAIL_LENGTH]
+        # Offsets are relative to the TIFF header that follows "Exif\0\0"
+        thumb = Image.open(BytesIO(exif_data[6 + offset:6 + offset + length]))
+        thumb.load()
+    except Exception:
+        return None
+
+    # Skip thumbnails that would be upscaled or that are letterboxed/cropped
+    same_shape = abs(thumb.width * img.height - thumb.height * img.width) <= max(img.width, img.height)
+    if not covers(thumb.size, max_size) or not same_shape:
+        return None
+    return thumb
+
+
+def reduce_decoding(img, max_size):
+    """Ask the decoder for the smallest resolution that still covers the preview"""
+    # Keep some headroom so the final LANCZOS pass still has detail to work with
+    target = (max_size[0] * REDUCING_GAP, max_size[1] * REDUCING_GAP)
+
+    if img.format == "JPEG":
+        # DCT scaling: decode at 1/2, 1/4 or 1/8 size
+        img.draft(img.mode, target)
+    elif img.format == "JPEG2000":
+        # Skip resolution levels of the wavelet pyramid
+        factor = 0
+        while factor < JPEG2000_MAX_REDUCE and covers((img.width >> (factor + 1), img.height >> (factor + 1)), target):
+            factor += 1
+        if factor:
+            img.reduce = factor
+            # The reduced size only takes effect once the image is loaded
+            img.load()
+    elif img.format == "TIFF":
+        select_tiff_level(img, target)
+
+
+def select_tiff_level(img, target):
+    """Switch a pyramidal TIFF to its smallest reduced-resolution page that covers target"""
+    if getattr(img, "n_frames", 1) < 2:
+        return
+    best_frame, best_size = 0, img.size
+    for frame in range(1, img.n_frames):
+        img.seek(frame)
+        # NewSubfileType bit 0 marks a reduced-resolution copy of the main image
+        if not img.tag_v2.get(TIFF_NEW_SUBFILE_TYPE, 0) & 1:
+            if frame == 1:
+                break  # an ordinary multi-page TIFF, not a pyramid
+            continue
+        if covers(img.size, target) and img.width < best_size[0]:
+            best_frame, best_size = frame, img.size
+    img.seek(best_frame)
+
+
+class ThumbnailCache:
+    """Least-recently-used thumbnail cache bounded by a memory budget
+
+    With a disk_cache (see disk_cache.DiskCache), memory misses fall back to
+    previews saved by earlier sessions before anything is decoded.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, disk_cache=None):
+        self.max_bytes = max_bytes
+        self.disk_cache = disk_cache
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._keys_by_path = {}
+        # Shared by the Tk thread and the prefetch thread
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached thumbnail for key, or None"""
+        with self._lock:
+            thumbnail = self._entries.get(key)
+            if thumbnail is not None:
+                self._entries.move_to_end(key)
+            return thumbnail
+
+    def put(self, key, thumbnail):
+        """Store a thumbnail, evicting the least recently used ones to stay in budget"""
+        with self._lock:
+            # A new mtime/size for the same path makes the old entry unreachable
+            old_key = self._keys_by_path.get(key[0])
+            if old_key is not None:
+                self._remove(old_key)
+
+            self._entries[key] = thumbnail
+            self._keys_by_path[key[0]] = key
+            self.total_bytes += thumbnail.nbytes
+
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+
+    def get_or_load(self, image_path, max_size=THUMBNAIL_SIZE):
+        """Return the thumbnail for image_path, decoding it on a cache miss"""
+        key = cache_key(image_path)
+        thumbnail = self.get(key)
+        if thumbnail is not None:
+            return thumbnail
+
+        if self.disk_cache is not None:
+            entry = self.disk_cache.get(key)
+            if entry is not None and entry[1] is not None:
+                try:
+                    thumbnail = decode_thumbnail(entry[1], entry[0])
+                except Exception:
+                    thumbnail = None
+
+        if thumbnail is None:
+            thumbnail = load_thumbnail(image_path, max_size, file_size=key[2])
+            if self.disk_cache is not None:
+                try:
+                    self.disk_cache.put(key, thumbnail.metadata, encode_thumbnail(thumbnail.image))
+                except Exception:
+                    # Not being able to store the preview is no reason not to show it
+                    pass
+
+        self.put(key, thumbnail)
+        return thumbnail
+
+    def clear(self):
+        """Drop every cached thumbnail"""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_path.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        thumbnail = self._entries.pop(key, None)
+        if thumbnail is not None:
+            self.total_bytes -= thumbnail.nbytes
+            if self._keys_by_path.get(key[0]) == key:
+                del self._keys_by_path[key[0]]
+
+
+class ThumbnailPrefetcher:
+    """Decode thumbnails on a background thread, nearest to the selection first
+
+    Each request replaces whatever is still queued, so jumping around the list
+    never leaves the worker busy with images the user has moved away from.
+    Only the requested image itself is reported back through the results queue,
+    which the Tk thread drains without blocking.
+    """
+
+    def __init__(self, cache, max_size=THUMBNAIL_SIZE):
+        self.cache = cache
+        self.max_size = max_size
+        self.results = queue.Queue()
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def request(self, image_path, neighbours=()):
+        """Load image_path (reported in results), then warm the cache for neighbours"""
+        with self._condition:
+            self._pending.clear()
+            self._pending.append((image_path, True))
+            self._pending.extend((path, False) for path in neighbours)
+            self._condition.notify()
+
+    def cancel(self):
+        """Drop all queued work"""
+        with self._condition:
+            self._pending.clear()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                image_path, report = self._pending.popleft()
+
+            try:
+                thumbnail = self.cache.get_or_load(image_path, self.max_size)
+            except Exception:
+                thumbnail = None
+            if report:
+                self.results.put((image_path, thumbnail))
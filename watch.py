@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Hot-folder mode for Image to PDF Converter
+Watches directories that scanners drop images into and converts them to PDFs
+without anyone opening the app:
+
+    python watch.py /srv/scans -o /srv/pdfs
+    python watch.py /srv/scans -o /srv/pdfs --pattern "^(?P<job>.+?)_\\d+" --window 60
+
+A file is picked up once its size and modification time have not changed for
+--settle seconds. Settled files are grouped into jobs (per directory, or per
+name prefix with --pattern); a group is converted when no file has joined it
+for --window seconds, when it reaches --max-files or when its oldest file
+has waited --max-wait seconds. A fixed number of jobs run at once, each with
+its share of the encoder processes, so a burst of arrivals queues up instead
+of overloading the machine. Inputs are moved to processed/ (or failed/) in
+the watched directory once their PDF is in place.
+"""
+
+import argparse
+import logging
+import os
+import re
+import shutil
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cli import add_encoding_options, encoding_options
+from engine import ConversionCancelled, convert_images, is_image_file, remove_files
+from journal import JOURNAL_SUFFIX
+from pdf_writer import PARTIAL_SUFFIX
+from sort_index import SortIndex
+
+log = logging.getLogger("watch")
+
+# Seconds between directory scans
+DEFAULT_POLL_SECONDS = 2.0
+
+# Seconds a file's size and mtime must stay unchanged before it is converted
+DEFAULT_SETTLE_SECONDS = 5.0
+
+# Seconds without a new file after which a group is converted
+DEFAULT_WINDOW_SECONDS = 30.0
+
+# Upper bounds on a group, so a steady trickle or a burst still makes progress
+DEFAULT_MAX_WAIT_SECONDS = 300.0
+DEFAULT_MAX_FILES = 500
+
+# Conversions running at the same time
+DEFAULT_JOBS = 2
+
+# Subdirectories of a watched directory that receive the inputs after conversion
+PROCESSED_DIR = "processed"
+FAILED_DIR = "failed"
+
+# Directory mtimes may only have this resolution (e.g. FAT, some network shares)
+COARSE_MTIME_SECONDS = 2.0
+
+
+class FolderWatcher:
+    """Poll directories and report each image file once its size and mtime settle
+
+    A directory is only listed again when its own mtime changes (a file was
+    created, renamed or removed in it); files already seen but still being
+    written are checked with a stat each poll.
+    """
+
+    def __init__(self, directories, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.directories = list(directories)
+        self.settle_seconds = settle_seconds
+        # path -> (size, mtime_ns, monotonic time it last changed)
+        self._pending = {}
+        # Settled files handed out and not yet moved away (or that could not be moved)
+        self._reported = set()
+        # directory -> (mtime_ns, wall clock time of the listing)
+        self._listed = {}
+
+    @property
+    def idle(self):
+        """No file is waiting to settle"""
+        return not self._pending
+
+    def poll(self, now=None):
+        """Scan for changes and return the files that have settled since the last poll"""
+        now = time.monotonic() if now is None else now
+        for directory in self.directories:
+            self._list(directory, now)
+
+        settled = []
+        for path, (size, mtime_ns, since) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Removed or renamed before it settled
+                del self._pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (st.st_size, st.st_mtime_ns, now)
+            elif st.st_size > 0 and now - since >= self.settle_seconds:
+                del self._pending[path]
+                self._reported.add(path)
+                settled.append(path)
+        return settled
+
+    def _list(self, directory, now):
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError as e:
+            log.warning("cannot watch %s: %s", directory, e)
+            return
+        previous = self._listed.get(directory)
+        # An unchanged mtime proves nothing if the listing happened within its resolution
+        if (previous is not None and previous[0] == mtime_ns
+                and previous[1] - mtime_ns / 1e9 > COARSE_MTIME_SECONDS):
+            return
+        self._listed[directory] = (mtime_ns, time.time())
+
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    path = entry.path
+                    if path in self._pending or path in self._reported:
+                        continue
+                    try:
+                        if not entry.is_file() or not is_image_file(entry.name):
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    self._pending[path] = (st.st_size, st.st_mtime_ns, now)
+        except OSError as e:
+            log.warning("cannot list %s: %s", directory, e)
+
+    def forget(self, path):
+        """Stop tracking a reported file: it was moved away, or should be picked up again"""
+        self._reported.discard(path)
+        # A file left in place would not show up again until its directory changed
+        self._listed.pop(os.path.dirname(path), None)
+
+
+class Batcher:
+    """Group settled files into jobs
+
+    Files are grouped by directory, or by the 'job' group (else the first
+    group) of pattern matched against the file name; files that don't match
+    are grouped by directory.
+    """
+
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS, max_files=DEFAULT_MAX_FILES,
+                 max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS, pattern=None):
+        self.window_seconds = window_seconds
+        self.max_files = max_files
+        self.max_wait_seconds = max_wait_seconds
+        self.pattern = re.compile(pattern) if pattern else None
+        # (directory, name) -> [files, first added, last added]
+        self._groups = {}
+
+    def __len__(self):
+        return len(self._groups)
+
+    def group_key(self, path):
+        directory, file_name = os.path.split(path)
+        if self.pattern is not None:
+            match = self.pattern.search(file_name)
+            if match is not None:
+                name = match.groupdict().get('job') or (match.group(1) if match.groups() else match.group(0))
+                if name:
+                    return directory, name
+        return directory, None
+
+    def add(self, path, now):
+        key = self.group_key(path)
+        group = self._groups.setdefault(key, [[], now, now])
+        group[0].append(path)
+        group[2] = now
+
+    def due(self, now, flush=False):
+        """Remove and return the groups ready to convert, as (key, files) pairs"""
+        ready = []
+        for key, (files, first, last) in list(self._groups.items()):
+            while len(files) >= self.max_files:
+                ready.append((key, files[:self.max_files]))
+                del files[:self.max_files]
+            if files and (flush or now - last >= self.window_seconds
+                          or now - first >= self.max_wait_seconds):
+                ready.append((key, files))
+                files = []
+            if files:
+                self._groups[key][0] = files
+            else:
+                del self._groups[key]
+        return ready
+
+
+class HotFolder:
+    """Watch, batch and convert: the daemon's main loop
+
+    Groups wait in a queue until one of the jobs slots is free; each job gets
+    workers // jobs encoder processes. options are passed to convert_images.
+    """
+
+    def __init__(self, output_dir, watcher, batcher, jobs=DEFAULT_JOBS,
+                 poll_seconds=DEFAULT_POLL_SECONDS, **options):
+        self.output_dir = output_dir
+        self.watcher = watcher
+        self.batcher = batcher
+        self.jobs = jobs
+        self.poll_seconds = poll_seconds
+        workers = options.pop('workers', None) or os.cpu_count() or 1
+        options['workers'] = max(1, workers // jobs)
+        self.options = options
+        self.stop_event = threading.Event()
+        self.cancel_event = threading.Event()
+        self._queue = deque()
+        self._running = {}
+        self._names = set()
+        self._sort_index = SortIndex()
+        self.converted = 0
+        self.failed = 0
+
+    def run(self, once=False):
+        """Poll until stop() (or, with once, until everything present has been converted)"""
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                # Natural name order, so a group split by --max-files keeps page runs together
+                for path in self._sort_index.sort(self.watcher.poll(now), 'natural'):
+                    self.batcher.add(path, now)
+                flush = once and self.watcher.idle
+                for key, files in self.batcher.due(now, flush=flush):
+                    self._queue.append((key, files))
+                    log.info("queued %d file%s from %s", len(files), "s" if len(files) != 1 else "",
+                             key[1] or key[0])
+
+                self._collect()
+                while self._queue and len(self._running) < self.jobs:
+                    key, files = self._queue.popleft()
+                    output_file = self._output_name(key)
+                    future = executor.submit(self._convert, files, output_file)
+                    self._running[future] = (files, output_file)
+
+                if once and flush and not self.batcher and not self._queue and not self._running:
+                    break
+                self.stop_event.wait(self.poll_seconds)
+        finally:
+            # Running jobs are cancelled; their inputs stay put for the next start
+            self.cancel_event.set()
+            executor.shutdown(wait=True)
+            self._collect()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _collect(self):
+        for future in [future for future in self._running if future.done()]:
+            files, output_file = self._running.pop(future)
+            self._names.discard(output_file)
+            result = future.result()
+            # Files that could not be moved away stay reported, or every poll would convert them again
+            unmoved = result[2] if result is not None else ()
+            for path in files:
+                # Files left in place (cancelled job) are picked up again later
+                if path not in unmoved:
+                    self.watcher.forget(path)
+            if result is not None:
+                self.converted += result[0]
+                self.failed += result[1]
+
+    def _output_name(self, key):
+        """A PDF name for a group that no finished or running job has taken"""
+        directory, name = key
+        base = name or os.path.basename(os.path.normpath(directory)) or "scan"
+        stem = f"{base}_{time.strftime('%Y%m%d-%H%M%S')}"
+        output_file = os.path.join(self.output_dir, stem + ".pdf")
+        number = 2
+        while output_file in self._names or os.path.exists(output_file):
+            output_file = os.path.join(self.output_dir, f"{stem}_{number}.pdf")
+            number += 1
+        self._names.add(output_file)
+        return output_file
+
+    def _convert(self, files, output_file):
+        """Convert one group and move its inputs aside; runs on a job thread
+
+        Returns (files converted, files failed, files that could not be moved),
+        or None if the job was cancelled.
+        """
+        files = self._sort_index.sort(files, 'natural')
+        skipped = {}
+
+        def skip(image_file, reason):
+            skipped[image_file] = reason
+            log.warning("skipped %s: %s", image_file, reason)
+
+        started = time.perf_counter()
+        try:
+            # Output names are never reused, so nothing would ever resume a failed job
+            pages = convert_images(files, output_file, cancel_event=self.cancel_event,
+                                   on_skip=skip, resume=False, **self.options)
+        except ConversionCancelled:
+            return None
+        except Exception as e:
+            remove_files([output_file + PARTIAL_SUFFIX, output_file + JOURNAL_SUFFIX])
+            log.error("failed to convert %d file%s into %s: %s", len(files),
+                      "s" if len(files) != 1 else "", os.path.basename(output_file), e)
+            return 0, len(files), self._move(files, FAILED_DIR, output_file)
+
+        log.info("wrote %s: %d page%s in %.1fs", output_file, pages, "s" if pages != 1 else "",
+                 time.perf_counter() - started)
+        unmoved = self._move([path for path in files if path not in skipped], PROCESSED_DIR,
+                             output_file)
+        unmoved += self._move(list(skipped), FAILED_DIR, output_file)
+        return len(files) - len(skipped), len(skipped), unmoved
+
+    def _move(self, files, folder, output_file):
+        """Move inputs to folder/<PDF name>/ next to where they were found
+
+        Returns the files that could not be moved; they are not converted
+        again until the daemon restarts.
+        """
+        stem = os.path.splitext(os.path.basename(output_file))[0]
+        unmoved = []
+        for path in files:
+            target_dir = os.path.join(os.path.dirname(path), folder, stem)
+            try:
+                os.makedirs(target_dir, exist_ok=True)
+                shutil.move(path, unique_path(os.path.join(target_dir, os.path.basename(path))))
+            except OSError as e:
+                log.error("cannot move %s to %s: %s; leaving it in place", path, target_dir, e)
+                unmoved.append(path)
+        return unmoved
+
+
+def unique_path(path):
+    """path, or path with a number added if something is already there"""
+    base, ext = os.path.splitext(path)
+    number = 2
+    while os.path.exists(path):
+        path = f"{base}_{number}{ext}"
+        number += 1
+    return path
+
+
+def build_parser():
+    """Create the argument parser"""
+    parser = argparse.ArgumentParser(
+        description="Watch folders and convert the images dropped into them into PDFs."
+    )
+    parser.add_argument("directories", nargs="+", metavar="DIRECTORY",
+                        help="directories to watch (not recursive)")
+    parser.add_argument("-o", "--output-dir", required=True,
+                        help="directory the PDFs are written to")
+    parser.add_argument("--pattern", default=None, metavar="REGEX",
+                        help="group files by this part of the name: the 'job' group, else the "
+                             "first group, of REGEX (default: one group per directory)")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW_SECONDS, metavar="SECONDS",
+                        help=f"convert a group once no file has joined it for this long "
+                             f"(default: {DEFAULT_WINDOW_SECONDS:g})")
+    parser.add_argument("--max-wait", type=float, default=DEFAULT_MAX_WAIT_SECONDS, metavar="SECONDS",
+                        help=f"convert a group at the latest this long after its first file "
+                             f"arrived (default: {DEFAULT_MAX_WAIT_SECONDS:g})")
+    parser.add_argument("--max-files", type=int, default=DEFAULT_MAX_FILES, metavar="N",
+                        help=f"most files in one PDF (default: {DEFAULT_MAX_FILES})")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS, metavar="SECONDS",
+                        help=f"how long a file must stay unchanged before it is converted "
+                             f"(default: {DEFAULT_SETTLE_SECONDS:g})")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_SECONDS, metavar="SECONDS",
+                        help=f"seconds between scans (default: {DEFAULT_POLL_SECONDS:g})")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"conversions running at once; encoder processes are divided "
+                             f"between them (default: {DEFAULT_JOBS})")
+    add_encoding_options(parser)
+    parser.add_argument("--once", action="store_true",
+                        help="convert what is in the directories now, then exit")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="only log warnings and errors")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    options = encoding_options(parser, args)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.max_files < 1:
+        parser.error("--max-files must be at least 1")
+    if min(args.window, args.max_wait, args.settle) < 0 or args.poll <= 0:
+        parser.error("times must be positive")
+    if args.pattern is not None:
+        try:
+            re.compile(args.pattern)
+        except re.error as e:
+            parser.error(f"invalid --pattern: {e}")
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            parser.error(f"not a directory: {directory}")
+
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    hot_folder = HotFolder(
+        args.output_dir,
+        FolderWatcher(args.directories, args.settle),
+        Batcher(args.window, args.max_files, args.max_wait, args.pattern),
+        jobs=args.jobs, poll_seconds=args.poll, **options
+    )
+    # Stop cleanly on a service manager's SIGTERM as well as on Ctrl+C
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, lambda signum, frame: hot_folder.stop())
+
+    log.info("watching %s", ", ".join(args.directories))
+    try:
+        hot_folder.run(once=args.once)
+    except KeyboardInterrupt:
+        log.info("interrupted, stopping")
+        hot_folder.stop()
+    log.info("converted %d file%s, %d failed", hot_folder.converted,
+             "s" if hot_folder.converted != 1 else "", hot_folder.failed)
+    return 1 if hot_folder.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())